@@ -1,11 +1,29 @@
+import datetime
+import os
+import tempfile
 import streamlit as st
 import db2 as db
-import pandas as pd
-import plotly.express as px
-
-# Initialize the database
+import db_async
+import db_replica
+import db_trace
+import auth
+import bulk
+import charts
+import jobs
+import metrics
+import snapshots
+import tenants
+
+# Initialize the database (a no-op after the first run in this process)
 db.init_db()
 
+# Background jobs run on worker threads shared by every session
+jobs.start()
+
+# Dashboard and report reads go to a periodically refreshed copy of the
+# database, so long scans never hold up the sell and add-car writes
+db_replica.start()
+
 # Set up page configuration
 st.set_page_config(page_title="Car Inventory Management", page_icon="🚗")
 
@@ -13,6 +31,10 @@ st.set_page_config(page_title="Car Inventory Management", page_icon="🚗")
 if 'authenticated' not in st.session_state:
     st.session_state['authenticated'] = False
 
+# Reruns trust the cached session instead of re-verifying the password
+if st.session_state['authenticated'] and not auth.session_user(st.session_state.get('session_token')):
+    st.session_state['authenticated'] = False
+
 # Show login or registration based on tab selection
 def login_tab():
     st.subheader("Login")
@@ -20,11 +42,19 @@ def login_tab():
     password = st.text_input("Password", type="password", key="login_password")
     
     if st.button("Login", key="login_button"):
-        if db.verify_user(username, password):
+        result = auth.login(username, password)
+        if result.status == auth.LOGIN_OK:
             st.session_state['authenticated'] = True
             st.session_state['username'] = username
+            st.session_state['session_token'] = result.token
             st.success("Login successful!")
             st.button("Start")
+        elif result.status == auth.LOGIN_RATE_LIMITED:
+            st.error("Too many login attempts. Please wait a minute and try again.")
+        elif result.status == auth.LOGIN_BUSY:
+            st.error("The server is busy. Please try again in a moment.")
+        elif result.status == auth.LOGIN_PENDING:
+            st.warning("Your account is waiting for an administrator to give it access.")
         else:
             st.error("Invalid username or password")
 
@@ -36,29 +66,102 @@ def register_tab():
     
     if st.button("Register", key="register_button"):
         if password == confirm_password:
-            if db.register_user(username, password):
-                st.success("Registration successful! Please log in.")
-            else:
+            status = auth.register(username, password)
+            if status == auth.REGISTER_OK:
+                st.success("Registration successful! You can log in once an administrator has given your account access.")
+            elif status == auth.REGISTER_TAKEN:
                 st.error("Username already exists. Please choose another.")
+            elif status == auth.LOGIN_RATE_LIMITED:
+                st.error("Too many registrations. Please wait a minute and try again.")
+            else:
+                st.error("The server is busy. Please try again in a moment.")
         else:
             st.error("Passwords do not match.")
 
+# Search box with type-ahead over the inventory and a selectbox of the best
+# matches; returns the chosen car (a db.Car record), or None after showing
+# `empty` when the inventory has no cars at all
+def car_picker(label, key, empty, limit=20):
+    query = st.text_input("Search cars", key=f"{key}_search", live=True,
+                          placeholder="Manufacture, model, plate, color...")
+    if query.strip():
+        cars = db.search_cars(query, limit=limit)
+    else:
+        cars, _ = db.query_cars(limit=limit)
+    if not cars:
+        st.info(empty if not query.strip() else "No cars match your search.")
+        return None
+    return st.selectbox(label, cars, format_func=lambda car: car.label, key=key)
+
+# Jobs page body; reruns on its own every few seconds to poll progress.
+# Those reruns skip main_app(), and with it tenants.using(), so the
+# dealership is passed in; fragment reruns reuse their arguments.
+@st.fragment(run_every=2)
+def jobs_list(tenant):
+    job_list = jobs.list_jobs(tenant)
+    if not job_list:
+        st.info("No jobs yet. Imports, exports and maintenance tasks run here.")
+        return
+    for job in job_list:
+        title = f"#{job.id} {job.kind.replace('_', ' ')} - {job.status}"
+        with st.expander(title, expanded=job.status in (jobs.JOB_QUEUED, jobs.JOB_RUNNING)):
+            started = datetime.datetime.fromtimestamp(job.created_at).strftime("%Y-%m-%d %H:%M:%S")
+            st.caption(f"Queued {started} by {job.created_by or 'system'}, attempt {job.attempts} of {job.max_attempts}")
+            if job.status == jobs.JOB_RUNNING:
+                st.progress(job.progress or 0.0, text=job.message or "Running...")
+            elif job.message:
+                st.write(job.message)
+            if job.error:
+                st.error(job.error)
+
+            if job.status in (jobs.JOB_QUEUED, jobs.JOB_RUNNING):
+                if st.button("Cancel", key=f"cancel_job_{job.id}"):
+                    jobs.cancel(job.id, tenant)
+                    st.rerun(scope="fragment")
+            elif job.status in (jobs.JOB_FAILED, jobs.JOB_CANCELLED):
+                if st.button("Retry", key=f"retry_job_{job.id}"):
+                    jobs.retry(job.id, tenant)
+                    st.rerun(scope="fragment")
+            elif job.kind == "export" and job.result and os.path.exists(job.result["path"]):
+                with open(job.result["path"], "rb") as f:
+                    st.download_button(f"Download {job.result['rows']} rows", f, file_name=job.result["file_name"],
+                                       key=f"download_job_{job.id}")
+            elif job.result:
+                st.json(job.result, expanded=False)
+
+# One row per label of a latency histogram, slowest first
+def histogram_table(histogram, label, name):
+    return sorted((
+        {name: dict(key).get(label, ""), "Count": s["count"], "Mean (ms)": s["mean"] * 1000,
+         "p95 (ms)": s["p95"] * 1000, "Max (ms)": s["max"] * 1000, "Total (s)": s["sum"]}
+        for key, s in histogram.summary().items()
+    ), key=lambda row: row["Total (s)"], reverse=True)
+
 def main_app():
     
 
     # Sidebar Navigation
     st.sidebar.header("📋 Navigation")
-    options = [ "View Inventory","Add New Car", "Update Car Info", "Delete Car", "Add Spare Parts", "Sell Car", "Sales Dashboard","Logout"]
+    options = [ "View Inventory","Add New Car", "Update Car Info", "Delete Car", "Add Spare Parts", "Sell Car", "Sales Dashboard", "Import / Export", "Jobs", "Metrics","Logout"]
+    # Every page works on the user's dealership; users without one also see
+    # reports across all dealerships
+    tenant = auth.session_tenant(st.session_state.get('session_token'))
+    dealerships = tenants.list_tenants() if tenant is None else []
+    if dealerships:
+        options.insert(options.index("Jobs"), "Group Reports")
     choice = st.sidebar.selectbox("Choose an option", options)
 
     # Header and container layout for main content
     st.title("🚗 Car Inventory Management")
 
-    with st.container():
+    with st.container(), tenants.using(tenant), metrics.timer("app_page_seconds", "Time to run a main_app() page", page=choice):
         st.write(f"Hello, **{st.session_state.get('username', 'User')}**!")
+        if tenant is not None:
+            st.caption(f"Dealership: {tenant}")
 
         # Handle logout
         if choice == "Logout":
+                auth.logout(st.session_state.get('session_token'))
                 st.session_state['authenticated'] = False
                 st.session_state['username'] = ""
 
@@ -71,8 +174,8 @@ def main_app():
                 model = st.text_input("Model")
                 specification = st.text_input("Specification")
                 kilometers = st.number_input("Kilometers", min_value=0)
-                gear_type = st.selectbox("Gear Type", ["Manual", "Automatic"])
-                fuel = st.selectbox("Fuel Type", ["Petrol", "Diesel", "Electric"])
+                gear_type = st.selectbox("Gear Type", db.GEAR_TYPES)
+                fuel = st.selectbox("Fuel Type", db.FUEL_TYPES)
                 license_plate = st.text_input("License Plate")
                 price = st.number_input("Price", min_value=0.0)
                 color = st.text_input("Color")
@@ -81,33 +184,29 @@ def main_app():
                 submitted = st.form_submit_button("Add Car")
                 
                 if submitted:
-                    db.add_car(manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items)
-                    st.success("Car added to inventory successfully!")
+                    if not license_plate:
+                        st.error("Please enter a license plate.")
+                    elif db.add_car(manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items):
+                        st.success("Car added to inventory successfully!")
+                    else:
+                        st.error("A car with this license plate is already in the inventory.")
 
         # Update Car Info
         elif choice == "Update Car Info":
             st.header("Update Car Information")
-            cars = db.get_all_cars()
-            
-            if not cars:
-                st.info("No cars available in the inventory to update.")
-            else:
-                car_dict = {f"{car[1]} {car[2]} ({car[7]})": car[0] for car in cars}
-                selected_car = st.selectbox("Select a Car", list(car_dict.keys()))
-                car_id = car_dict.get(selected_car)
-
-                car = next(car for car in cars if car[0] == car_id)
+            if car := car_picker("Select a Car", "update_car", "No cars available in the inventory to update."):
+                car_id = car.id
                     
                 # Display fields for updating
-                manufacture = st.text_input("Manufacture", value=car[1])
-                model = st.text_input("Model", value=car[2])
-                specification = st.text_input("Specification", value=car[3])
-                kilometers = st.number_input("Kilometers", min_value=0, value=car[4])
-                gear_type = st.selectbox("Gear Type", ["Manual", "Automatic"], index=["Manual", "Automatic"].index(car[5]))
-                fuel = st.selectbox("Fuel Type", ["Petrol", "Diesel", "Electric"], index=["Petrol", "Diesel", "Electric"].index(car[6]))
-                price = st.number_input("Price", min_value=0.0, value=car[8])
-                color = st.text_input("Color", value=car[9])
-                extra_items = st.text_area("Extra Items", value=car[10])
+                manufacture = st.text_input("Manufacture", value=car.manufacture)
+                model = st.text_input("Model", value=car.model)
+                specification = st.text_input("Specification", value=car.specification)
+                kilometers = st.number_input("Kilometers", min_value=0, value=car.kilometers)
+                gear_type = st.selectbox("Gear Type", db.GEAR_TYPES, index=db.GEAR_TYPES.index(car.gear_type))
+                fuel = st.selectbox("Fuel Type", db.FUEL_TYPES, index=db.FUEL_TYPES.index(car.fuel))
+                price = st.number_input("Price", min_value=0.0, value=car.price)
+                color = st.text_input("Color", value=car.color)
+                extra_items = st.text_area("Extra Items", value=car.extra_items)
 
                     
                 if st.button("Update Car"):
@@ -119,14 +218,8 @@ def main_app():
         # Delete Car
         elif choice == "Delete Car":
             st.header("Delete a Car from Inventory")
-            cars = db.get_all_cars()
-
-            if not cars:
-                st.info("No cars available in the inventory to delete.")
-            else:
-                car_dict = {f"{car[1]} {car[2]} ({car[7]})": car[0] for car in cars}
-                selected_car = st.selectbox("Select a Car to Delete", list(car_dict.keys()))
-                car_id = car_dict.get(selected_car)
+            if car := car_picker("Select a Car to Delete", "delete_car", "No cars available in the inventory to delete."):
+                car_id = car.id
 
                 if st.button("Delete Car") and car_id:
                     db.delete_car(car_id)
@@ -136,13 +229,8 @@ def main_app():
         # Add Spare Parts
         elif choice == "Add Spare Parts":
             st.header("Add Spare Parts Cost for a Car")
-            cars = db.get_all_cars()
-            if not cars:
-                st.info("No cars available in the inventory to add Spare Parts.")
-            else:
-                car_dict = {f"{car[1]} {car[2]} ({car[7]})": car[0] for car in cars}
-                selected_car = st.selectbox("Select a Car", list(car_dict.keys()))
-                car_id = car_dict[selected_car]
+            if car := car_picker("Select a Car", "spare_parts_car", "No cars available in the inventory to add Spare Parts."):
+                car_id = car.id
             
                 with st.form("spare_part_form"):
                     part_name = st.text_input("Part Name")
@@ -158,157 +246,361 @@ def main_app():
             # Improved Sell Car Page
             st.title("Sell a Car")
             # Retrieve available cars
-            cars = db.get_all_cars()
-            if not cars:
-                st.info("No cars available in the inventory to sell.")
-            else:
-                car_dict = {f"{car[1]} {car[2]} ({car[7]})": car[0] for car in cars}
-                selected_car = st.selectbox("Select a Car", list(car_dict.keys()))
-                car_id = car_dict[selected_car]
+            if selected_car := car_picker("Select a Car", "sell_car", "No cars available in the inventory to sell."):
+                car_id = selected_car.id
                 
-                if cars:
-                    for car in cars:
-                        car = next(car for car in cars if car[0] == car_id)
-                        car_id, manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items = car
-                        spare_parts_cost = db.get_spare_parts_cost(car_id) or 0.0
-                        total_cost = float(price) + float(spare_parts_cost)  # Calculate total cost
+                # The selected car and its spare parts cost in one query
+                car = db.get_car_with_parts_cost(car_id)
+                if car:
+                    total_cost = car.total_cost
 
                     # Car Display Card
                     with st.container():
-                        st.subheader(f"{manufacture} {model} ({license_plate})")
-                        st.write(f"Specification: {specification}")
-                        st.write(f"Kilometers: {kilometers} km")
-                        st.write(f"Gear Type: {gear_type}, Fuel Type: {fuel}")
-                        st.write(f"Color: {color}")
-                        st.write(f"Extra Items: {extra_items}")
-                        st.write(f"Base Price: ${price:,.2f}")
-                        st.write(f"Spare Parts Cost: ${spare_parts_cost:,.2f}")
+                        st.subheader(car.label)
+                        st.write(f"Specification: {car.specification}")
+                        st.write(f"Kilometers: {car.kilometers} km")
+                        st.write(f"Gear Type: {car.gear_type}, Fuel Type: {car.fuel}")
+                        st.write(f"Color: {car.color}")
+                        st.write(f"Extra Items: {car.extra_items}")
+                        st.write(f"Base Price: ${car.price:,.2f}")
+                        st.write(f"Spare Parts Cost: ${car.spare_parts_cost:,.2f}")
                         st.write(f"**Total Cost: ${total_cost:,.2f}**")
 
                         # Sale Price Input and Confirm Sale Button
-                        sale_price = st.number_input(f"Enter Sale Price for {manufacture} {model} ({license_plate})", min_value=0.0, value=total_cost, key=f"sale_price_{car_id}")
-                        confirm_button = st.button(f"Confirm Sale for {manufacture} {model} ({license_plate})", key=f"confirm_{car_id}")
+                        sale_price = st.number_input(f"Enter Sale Price for {car.label}", min_value=0.0, value=total_cost, key=f"sale_price_{car_id}")
+                        confirm_button = st.button(f"Confirm Sale for {car.label}", key=f"confirm_{car_id}")
 
                         # Handle Sale Confirmation
                         if confirm_button:
                             if sale_price <= 0:
                                 st.warning("Please enter a valid sale price.")
                             else:
-                                # Confirm Sale Modal
-                                with st.expander("Confirm Sale Details",True):
-                                    st.write(f"**Manufacture**: {manufacture}")
-                                    st.write(f"**Model**: {model}")
-                                    st.write(f"**License Plate**: {license_plate}")
-                                    st.write(f"**Total Sale Price**: ${sale_price:,.2f}")
-                                    st.write(f"**Profit**: ${sale_price - total_cost:,.2f}")
-
-                                    # Show Sale Summary for Confirmation
-                                    st.write(f"**Confirming Sale Details** for {manufacture} {model}")
-                                    st.write(f"**Total Sale Price**: ${sale_price:,.2f}")
-                                    st.write(f"**Profit**: ${sale_price - total_cost:,.2f}")
-
-                                    # Finalize Sale and Remove Car from Inventory
-                                    db.add_sale(car_id, manufacture, model, specification, license_plate, sale_price, total_cost)
-                                    db.delete_car(car_id)
-                                    st.success(f"Sale completed for {manufacture} {model} ({license_plate}) and car removed from inventory.")
+                                # Finalize Sale and Remove Car from Inventory in a single transaction
+                                result = db.sell_car(car_id, sale_price)
+                                if result.status == db.SALE_CONFLICT:
+                                    st.error(f"{car.label} is no longer in the inventory. It may have just been sold in another session.")
+                                else:
+                                    # Confirm Sale Modal
+                                    with st.expander("Confirm Sale Details",True):
+                                        st.write(f"**Manufacture**: {car.manufacture}")
+                                        st.write(f"**Model**: {car.model}")
+                                        st.write(f"**License Plate**: {car.license_plate}")
+                                        st.write(f"**Total Sale Price**: ${result.sale_price:,.2f}")
+                                        st.write(f"**Profit**: ${result.profit:,.2f}")
+
+                                    st.success(f"Sale completed for {car.label} and car removed from inventory.")
                 else:
-                    st.warning("No cars available in inventory.")
+                    st.warning("This car is no longer in the inventory.")
 
         # View Inventory
         elif choice == "View Inventory":
             st.header("Current Inventory Overview")
-            
-            cars = db.get_car_with_spare_parts()
-            total_inventory_cost = 0
+
+            # Filters and sorting are pushed down into SQL; only one page is fetched.
+            # Filter options and unfiltered totals come from the shared snapshot,
+            # which re-reads only the cars changed since the last rerun.
+            manufactures, models = snapshots.filter_options()
+            with st.expander("Filter and Sort", expanded=False):
+                col1, col2 = st.columns(2)
+                with col1:
+                    manufacture = st.selectbox("Manufacture", ["All"] + manufactures, key="inv_manufacture")
+                    gear_type = st.selectbox("Gear Type", ["All"] + db.GEAR_TYPES, key="inv_gear_type")
+                    min_price = st.number_input("Min Price", min_value=0.0, value=0.0, key="inv_min_price")
+                    min_kilometers = st.number_input("Min Kilometers", min_value=0, value=0, key="inv_min_km")
+                    sort_by = st.selectbox("Sort By", list(db.CAR_SORT_COLUMNS), key="inv_sort_by")
+                with col2:
+                    model = st.selectbox("Model", ["All"] + models, key="inv_model")
+                    fuel = st.selectbox("Fuel Type", ["All"] + db.FUEL_TYPES, key="inv_fuel")
+                    max_price = st.number_input("Max Price (0 = no limit)", min_value=0.0, value=0.0, key="inv_max_price")
+                    max_kilometers = st.number_input("Max Kilometers (0 = no limit)", min_value=0, value=0, key="inv_max_km")
+                    descending = st.checkbox("Descending", key="inv_descending")
+                page_size = st.selectbox("Cars per Page", [10, 25, 50, 100], index=1, key="inv_page_size")
+
+            filters = {
+                "manufacture": None if manufacture == "All" else manufacture,
+                "model": None if model == "All" else model,
+                "gear_type": None if gear_type == "All" else gear_type,
+                "fuel": None if fuel == "All" else fuel,
+                "min_price": min_price or None,
+                "max_price": max_price or None,
+                "min_kilometers": min_kilometers or None,
+                "max_kilometers": max_kilometers or None,
+            }
+
+            # Cursors of the pages visited so far; reset whenever the query changes
+            query_key = (tuple(sorted(filters.items())), sort_by, descending, page_size)
+            if st.session_state.get('inventory_query') != query_key:
+                st.session_state['inventory_query'] = query_key
+                st.session_state['inventory_cursors'] = [None]
+            cursors = st.session_state['inventory_cursors']
+
+            cars, next_cursor = db.query_cars(filters, sort_by=sort_by, descending=descending,
+                                              after=cursors[-1], limit=page_size)
+            if any(value is not None for value in filters.values()):
+                car_count, total_inventory_cost = db.get_inventory_totals(filters)
+            else:
+                car_count, total_inventory_cost = snapshots.inventory_totals()
 
             if cars:
+                st.caption(f"Page {len(cursors)} - {car_count} cars")
                 for car in cars:
-                    car_id, manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items, spare_parts_cost = car
-                    total_car_cost = price + spare_parts_cost
-                    total_inventory_cost += total_car_cost
-
-                    with st.expander(f"{manufacture} {model} ({license_plate}) - ${total_car_cost:.2f}", expanded=False):
-                        st.markdown(f"**Specification**: {specification}")
-                        st.markdown(f"**Kilometers**: {kilometers} km")
-                        st.markdown(f"**Gear Type**: {gear_type}")
-                        st.markdown(f"**Fuel Type**: {fuel}")
-                        st.markdown(f"**Color**: {color}")
-                        st.markdown(f"**Extra Items**: {extra_items}")
-                        st.markdown(f"**Base Price**: ${price:.2f}")
-                        st.markdown(f"**Spare Parts Cost**: ${spare_parts_cost:.2f}")
+                    total_car_cost = car.total_cost
+
+                    with st.expander(f"{car.label} - ${total_car_cost:.2f}", expanded=False):
+                        st.markdown(f"**Specification**: {car.specification}")
+                        st.markdown(f"**Kilometers**: {car.kilometers} km")
+                        st.markdown(f"**Gear Type**: {car.gear_type}")
+                        st.markdown(f"**Fuel Type**: {car.fuel}")
+                        st.markdown(f"**Color**: {car.color}")
+                        st.markdown(f"**Extra Items**: {car.extra_items}")
+                        st.markdown(f"**Base Price**: ${car.price:.2f}")
+                        st.markdown(f"**Spare Parts Cost**: ${car.spare_parts_cost:.2f}")
                         st.markdown(f"**Total Cost for Car**: ${total_car_cost:.2f}")
                         
                         st.markdown("---")
 
+                prev_col, next_col = st.columns(2)
+                with prev_col:
+                    if st.button("⬅ Previous", disabled=len(cursors) == 1):
+                        cursors.pop()
+                        st.rerun()
+                with next_col:
+                    if st.button("Next ➡", disabled=next_cursor is None):
+                        cursors.append(next_cursor)
+                        st.rerun()
+
                 st.subheader("💰 Total Inventory Cost")
                 st.markdown(f"**${total_inventory_cost:.2f}**")
             else:
                 st.info("No cars available in the inventory.")
 
+        elif choice == "Import / Export":
+            st.header("Bulk Import and Export")
+
+            st.subheader("Import")
+            import_kind = st.radio("What to import", ["Cars", "Spare Parts"], horizontal=True)
+            columns = bulk.CAR_COLUMNS if import_kind == "Cars" else bulk.SPARE_PART_COLUMNS
+            st.caption(f"Expected columns: {', '.join(columns)}")
+            upload = st.file_uploader("CSV or Parquet file", type=["csv", "parquet"])
+
+            if upload is not None and st.button("Import"):
+                # Save the upload for the job runner, which imports it off this thread
+                kind = "import_cars" if import_kind == "Cars" else "import_spare_parts"
+                fmt = "parquet" if upload.name.lower().endswith(".parquet") else "csv"
+                fd, path = tempfile.mkstemp(suffix=f".{fmt}", prefix="upload-", dir=jobs.files_dir())
+                with os.fdopen(fd, "wb") as f:
+                    f.write(upload.getbuffer())
+                job_id = jobs.submit(kind, {"path": path, "format": fmt, "file_name": upload.name},
+                                     created_by=st.session_state.get('username'))
+                st.success(f"Import queued as job #{job_id}. Follow it on the Jobs page.")
+
+            st.subheader("Export")
+            export_name = st.selectbox("Data", sorted(bulk.EXPORTS))
+            export_format = st.selectbox("Format", ["csv", "parquet"])
+            if st.button("Prepare Export"):
+                job_id = jobs.submit("export", {"name": export_name, "format": export_format},
+                                     created_by=st.session_state.get('username'))
+                st.success(f"Export queued as job #{job_id}. Download it from the Jobs page when it is done.")
+
         elif choice == "Sales Dashboard":
             st.header("Sales Dashboard")
 
-            # Retrieve sales and car data from the database
-            sales = db.get_all_sales()
-            cars = db.get_all_cars()  # Used for additional car details if needed
+            # Every read on this page comes from the same replica generation
+            analytics = db_replica.path()
+            if replica := db_replica.get_replica():
+                st.caption(f"Figures as of {replica.age():.0f} seconds ago, refreshed at least every {replica.max_age:.0f} seconds.")
+            with db.using(analytics):
+                first_day, last_day = db.get_sales_date_range()
 
             # Check if sales data exists
-            if not sales:
+            if first_day is None:
                 st.info("No sales data available. Please complete a sale first.")
             else:
-                # Convert sales data to a DataFrame
-                sales_df = pd.DataFrame(sales, columns=["Sale ID", "Car ID", "Manufacture", "Model", "Specification", 
-                                                        "License Plate", "Sale Price", "Sale Cost", "Sale Date"])
-                
-                # Calculate profit for each sale and add it as a new column
-                sales_df['Profit'] = sales_df['Sale Price'] - sales_df['Sale Cost']
-
-                # Display historical sales data in a table
-                st.subheader("Sales Data History")
-                st.dataframe(sales_df)
-
-                # Graph 1: Profit per Sale
-                st.subheader("Profit per Sale")
-                fig_profit = px.bar(sales_df, x="Sale Date", y="Profit", color="Profit",
-                                    title="Profit per Sale Over Time", labels={"Profit": "Profit ($)"})
-                st.plotly_chart(fig_profit)
-
-                # Graph 2: Sales Trends Over Time
-                st.subheader("Total Sales and Profit Trends")
-                trend_df = sales_df.groupby("Sale Date").agg(
-                    Total_Sales=('Sale Price', 'sum'),
-                    Total_Profit=('Profit', 'sum')
-                ).reset_index()
-                fig_trends = px.line(trend_df, x="Sale Date", y=["Total_Sales", "Total_Profit"],
-                                    title="Total Sales and Profit Trends Over Time",
-                                    labels={"value": "Amount ($)", "variable": "Metric"})
-                fig_trends.update_layout(yaxis_title="Amount ($)")
-                st.plotly_chart(fig_trends)
-
-                # Graph 3: Top-Selling Models
-                st.subheader("Top-Selling Car Models")
-                model_counts = sales_df['Model'].value_counts().reset_index()
-                model_counts.columns = ["Model", "Sales Count"]
-                fig_models = px.bar(model_counts, x="Model", y="Sales Count", color="Sales Count",
-                                    title="Top-Selling Car Models", labels={"Sales Count": "Number of Sales"})
-                st.plotly_chart(fig_models)
-
-                # Graph 4: Average Sale Price by Manufacturer
-                st.subheader("Average Sale Price by Manufacturer")
-                avg_price_df = sales_df.groupby("Manufacture")['Sale Price'].mean().reset_index()
-                fig_avg_price = px.bar(avg_price_df, x="Manufacture", y="Sale Price", 
-                                    title="Average Sale Price by Manufacturer", 
-                                    labels={"Sale Price": "Average Sale Price ($)"})
-                st.plotly_chart(fig_avg_price)
-
-                # Summary Statistics
-                st.subheader("Sales Summary Statistics")
-                total_sales = sales_df['Sale Price'].sum()
-                total_profit = sales_df['Profit'].sum()
-                avg_profit = sales_df['Profit'].mean()
-                st.write(f"**Total Sales:** ${total_sales:,.2f}")
-                st.write(f"**Total Profit:** ${total_profit:,.2f}")
-                st.write(f"**Average Profit per Sale:** ${avg_profit:,.2f}")
+                # Imported here so other pages never pay for loading them
+                import pandas as pd
+                import plotly.express as px
+
+                first_day = datetime.date.fromisoformat(first_day)
+                last_day = datetime.date.fromisoformat(last_day)
+                default_window = (max(first_day, last_day - datetime.timedelta(days=364)), last_day)
+                window = st.date_input("Date Range", value=default_window,
+                                       min_value=first_day, max_value=last_day, key="dash_range")
+                # Mid-selection the widget holds just the start date, and
+                # nothing at all once cleared
+                if len(window) == 2:
+                    start, end = window
+                elif window:
+                    start = end = window[0]
+                else:
+                    start, end = default_window
+
+                # Everything is aggregated in SQL, bucketed by day, week or month
+                # depending on the window, so chart sizes do not grow with history.
+                # The queries are independent, so they run concurrently.
+                period = db.sales_period_for(start, end)
+                with db.using(analytics):
+                    summary, sales_trend, model_sales, manufacturer_prices = db_async.run(
+                        db_async.get_sales_summary(start, end),
+                        db_async.get_sales_trend(period, start, end),
+                        db_async.get_model_sales_counts(start, end, limit=20),
+                        db_async.get_manufacturer_average_prices(start, end),
+                    )
+                sales_count, total_sales, total_profit = summary
+                period_name = period.capitalize()
+
+                if not sales_count:
+                    st.info("No sales in this date range.")
+                else:
+                    # Sales in the window, one page at a time
+                    st.subheader("Sales")
+                    page_size = st.selectbox("Sales per Page", [25, 50, 100], index=1, key="dash_page_size")
+                    query_key = (start, end, page_size)
+                    if st.session_state.get('sales_query') != query_key:
+                        st.session_state['sales_query'] = query_key
+                        st.session_state['sales_cursors'] = [None]
+                    cursors = st.session_state['sales_cursors']
+
+                    with db.using(analytics):
+                        sales, next_cursor = db.get_sales_page(start, end, before=cursors[-1], limit=page_size)
+                    sales_df = pd.DataFrame([tuple(sale) for sale in sales],
+                                            columns=["Sale ID", "Car ID", "Manufacture", "Model", "Specification",
+                                                     "License Plate", "Sale Price", "Sale Cost", "Sale Date"])
+                    sales_df['Profit'] = sales_df['Sale Price'] - sales_df['Sale Cost']
+                    st.caption(f"Page {len(cursors)} - {sales_count} sales")
+                    st.dataframe(sales_df, hide_index=True)
+
+                    prev_col, next_col = st.columns(2)
+                    with prev_col:
+                        if st.button("⬅ Previous", disabled=len(cursors) == 1, key="sales_previous"):
+                            cursors.pop()
+                            st.rerun()
+                    with next_col:
+                        if st.button("Next ➡", disabled=next_cursor is None, key="sales_next"):
+                            cursors.append(next_cursor)
+                            st.rerun()
+
+                    trend_df = pd.DataFrame(sales_trend, columns=["Sale Date", "Sales Count", "Total_Sales", "Total_Profit"])
+                    # At most charts.MAX_CHART_POINTS points per series
+                    trend_df = charts.downsample(trend_df, "Sale Date", "Total_Sales")
+
+                    # Graph 1: Profit per Day, Week or Month
+                    st.subheader(f"Profit per {period_name}")
+                    fig_profit = px.bar(trend_df, x="Sale Date", y="Total_Profit", color="Total_Profit",
+                                        title=f"Profit per {period_name}",
+                                        labels={"Total_Profit": "Profit ($)"})
+                    st.plotly_chart(fig_profit)
+
+                    # Graph 2: Sales Trends Over Time
+                    st.subheader("Total Sales and Profit Trends")
+                    fig_trends = px.line(trend_df, x="Sale Date", y=["Total_Sales", "Total_Profit"],
+                                        title=f"Total Sales and Profit per {period_name}",
+                                        labels={"value": "Amount ($)", "variable": "Metric"})
+                    fig_trends.update_layout(yaxis_title="Amount ($)")
+                    st.plotly_chart(fig_trends)
+
+                    # Graph 3: Top-Selling Models
+                    st.subheader("Top-Selling Car Models")
+                    model_counts = pd.DataFrame(model_sales, columns=["Model", "Sales Count"])
+                    fig_models = px.bar(model_counts, x="Model", y="Sales Count", color="Sales Count",
+                                        title="Top-Selling Car Models", labels={"Sales Count": "Number of Sales"})
+                    st.plotly_chart(fig_models)
+
+                    # Graph 4: Average Sale Price by Manufacturer
+                    st.subheader("Average Sale Price by Manufacturer")
+                    avg_price_df = pd.DataFrame(manufacturer_prices, columns=["Manufacture", "Sale Price"])
+                    fig_avg_price = px.bar(avg_price_df, x="Manufacture", y="Sale Price", 
+                                        title="Average Sale Price by Manufacturer", 
+                                        labels={"Sale Price": "Average Sale Price ($)"})
+                    st.plotly_chart(fig_avg_price)
+
+                    # Summary Statistics
+                    st.subheader("Sales Summary Statistics")
+                    avg_profit = total_profit / sales_count
+                    st.write(f"**Total Sales:** ${total_sales:,.2f}")
+                    st.write(f"**Total Profit:** ${total_profit:,.2f}")
+                    st.write(f"**Average Profit per Sale:** ${avg_profit:,.2f}")
+
+        elif choice == "Group Reports":
+            st.header("Group Reports")
+            st.caption("Totals across dealerships; each dealership's database is queried in parallel.")
+
+            names = {None: "Main", **{dealership.id: dealership.name for dealership in dealerships}}
+            sales, sales_total = tenants.group_sales_summary()
+            stock, stock_total = tenants.group_inventory_totals()
+            rows = [(names.get(key, key), stock[key], sales[key]) for key in sales]
+            rows.append(("Total", stock_total, sales_total))
+            st.dataframe([{"Dealership": name, "Cars in Stock": cars, "Inventory Cost": cost,
+                           "Sales": count, "Revenue": revenue, "Profit": profit}
+                          for name, (cars, cost), (count, revenue, profit) in rows], hide_index=True)
+
+        elif choice == "Jobs":
+            st.header("Background Jobs")
+
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("Rebuild Sales Rollups"):
+                    jobs.submit("rebuild_rollups", created_by=st.session_state.get('username'))
+            with col2:
+                if st.button("Vacuum Database"):
+                    jobs.submit("vacuum", created_by=st.session_state.get('username'))
+
+            jobs_list(tenant)
+
+        elif choice == "Metrics":
+            st.header("Metrics")
+            st.caption("Counters and timings since this server process started.")
+
+            st.subheader("Pages")
+            st.dataframe(histogram_table(metrics.registry.histogram("app_page_seconds"), "page", "Page"), hide_index=True)
+
+            st.subheader("Data Layer Calls")
+            calls = histogram_table(db_trace.call_seconds, "function", "Function")
+            rows = {dict(key)["function"]: count for key, count in db_trace.call_rows.samples().items()}
+            waits = {dict(key)["function"]: s["sum"] * 1000 for key, s in db_trace.call_wait.summary().items()}
+            for row in calls:
+                row["Rows"] = rows.get(row["Function"], 0)
+                row["Connection Wait (ms)"] = waits.get(row["Function"], 0.0)
+            st.dataframe(calls, hide_index=True)
+
+            st.subheader("SQL Statements")
+            st.dataframe(histogram_table(db_trace.statement_seconds, "statement", "Statement"), hide_index=True)
+
+            st.subheader("Slow Queries")
+            # The logging threshold is process-wide (db_trace.SLOW_QUERY_SECONDS);
+            # this only narrows down what is shown
+            logged_ms = int(db_trace.SLOW_QUERY_SECONDS * 1000)
+            st.caption(f"Statements slower than {logged_ms} ms are logged with their query plan.")
+            threshold_ms = st.number_input("Show statements slower than (ms)", min_value=logged_ms, value=logged_ms, step=10)
+            slow = [entry for entry in db_trace.slow_queries() if entry['seconds'] * 1000 >= threshold_ms]
+            if slow:
+                for entry in slow:
+                    with st.expander(f"{entry['seconds'] * 1000:.1f} ms, {entry['rows']} rows: {entry['statement'][:80]}"):
+                        st.code(entry['statement'], language="sql")
+                        st.code("\n".join(entry['plan']) if entry['plan'] else "No query plan available")
+                if st.button("Clear Slow Query Log"):
+                    db_trace.clear_slow_queries()
+            else:
+                st.info("No statements over the threshold yet.")
+
+            st.subheader("Connection Pool, Read Cache and Analytics Replica")
+            replica = db_replica.get_replica()
+            st.json({"pool": db.pool_stats(), "cache": db.cache_stats(), "replica": replica.stats() if replica else None})
+
+            st.subheader("Prometheus Export")
+            text = metrics.registry.to_prometheus()
+            st.download_button("Download metrics.prom", text, file_name="metrics.prom")
+            metrics_path = os.path.join(os.path.dirname(os.path.abspath(db.DB_PATH)), metrics.PROMETHEUS_FILE)
+            if st.button(f"Write {metrics.PROMETHEUS_FILE}"):
+                metrics.registry.write_prometheus(metrics_path)
+                st.success(f"Wrote {metrics_path}")
+            if st.button("Start Endpoint"):
+                try:
+                    server = metrics.serve_prometheus(metrics.PROMETHEUS_PORT)
+                except OSError as e:
+                    # Usually the port is taken, e.g. by another app process
+                    st.error(f"Could not serve metrics on port {metrics.PROMETHEUS_PORT}: {e}")
+                else:
+                    st.success(f"Serving http://{server.server_address[0]}:{server.server_address[1]}/metrics")
 
 # Display login and registration in tabs if not authenticated
 if not st.session_state.get('authenticated', False):
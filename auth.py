@@ -0,0 +1,278 @@
+# auth.py
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import db2
+
+# Password hashing. New hashes use scrypt (or PBKDF2 where OpenSSL lacks it);
+# unsalted SHA-256 hex digests from older versions are still accepted and are
+# replaced with a new hash on the next successful login.
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 200_000
+SALT_BYTES = 16
+
+# At most AUTH_WORKERS hashes run at once; beyond MAX_PENDING queued
+# verifications and registrations new ones are turned away instead of
+# piling up
+AUTH_WORKERS = 4
+MAX_PENDING = 64
+VERIFY_TIMEOUT = 10.0
+
+# Per-username token bucket: LOGIN_BURST attempts, refilled at LOGIN_RATE per second
+LOGIN_BURST = 5
+LOGIN_RATE = 1 / 12
+
+# Registrations are anonymous, so they share one bucket for the process
+REGISTER_BURST = 10
+REGISTER_RATE = 1 / 6
+
+SESSION_TTL = 8 * 60 * 60
+# Expired sessions are dropped by SessionCache.create() at most this often
+SESSION_PURGE_INTERVAL = 60
+
+LOGIN_OK = "ok"
+LOGIN_INVALID = "invalid"
+LOGIN_RATE_LIMITED = "rate_limited"
+LOGIN_BUSY = "busy"
+# Right password, but no administrator has assigned the account yet
+LOGIN_PENDING = "pending"
+
+# register() answers these, or LOGIN_RATE_LIMITED and LOGIN_BUSY for the
+# same reasons as login()
+REGISTER_OK = "registered"
+REGISTER_TAKEN = "taken"
+
+# tenant is the dealership the user works for, None for group-wide users
+LoginResult = namedtuple("LoginResult", ["status", "token", "tenant"], defaults=(None,))
+
+
+def hash_password(password):
+    salt = os.urandom(SALT_BYTES)
+    if hasattr(hashlib, "scrypt"):
+        digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P)
+        return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${digest.hex()}"
+
+
+def is_legacy_hash(stored):
+    return "$" not in stored
+
+
+def check_password(password, stored):
+    if stored is None:
+        return False
+    if is_legacy_hash(stored):
+        digest = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(digest, stored)
+
+    scheme, *params = stored.split("$")
+    if scheme == "scrypt":
+        n, r, p, salt, expected = params
+        digest = hashlib.scrypt(password.encode(), salt=bytes.fromhex(salt), n=int(n), r=int(r), p=int(p))
+    elif scheme == "pbkdf2_sha256":
+        iterations, salt, expected = params
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), int(iterations))
+    else:
+        return False
+    return hmac.compare_digest(digest.hex(), expected)
+
+
+class TokenBucket:
+    """Per-key token buckets; each attempt takes one token."""
+
+    def __init__(self, burst=LOGIN_BURST, rate=LOGIN_RATE, max_keys=10000):
+        self.burst = burst
+        self.rate = rate
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def allow(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return allowed
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full = [key for key, (tokens, last) in self._buckets.items()
+                if tokens + (now - last) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+
+class SessionCache:
+    """Verified logins by opaque session token, valid for `ttl` seconds.
+
+    Each session also records the user's dealership (see tenants.py), so
+    reruns route their queries without another lookup.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, purge_interval=SESSION_PURGE_INTERVAL):
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._next_purge = time.monotonic() + purge_interval
+
+    def create(self, username, tenant=None):
+        token = secrets.token_urlsafe(32)
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[token] = (username, tenant, now + self.ttl)
+            if now >= self._next_purge:
+                self._purge(now)
+        return token
+
+    def _session(self, token):
+        if not token:
+            return None
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is None:
+                return None
+            if session[2] <= time.monotonic():
+                del self._sessions[token]
+                return None
+            return session
+
+    def get(self, token):
+        session = self._session(token)
+        return session[0] if session else None
+
+    def tenant(self, token):
+        session = self._session(token)
+        return session[1] if session else None
+
+    def end(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def purge_expired(self):
+        with self._lock:
+            self._purge(time.monotonic())
+
+    def _purge(self, now):
+        # Call with self._lock held
+        for token in [t for t, (_, _, expires) in self._sessions.items() if expires <= now]:
+            del self._sessions[token]
+        self._next_purge = now + self.purge_interval
+
+
+_executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+limiter = TokenBucket()
+registration_limiter = TokenBucket(REGISTER_BURST, REGISTER_RATE)
+sessions = SessionCache()
+
+
+def _verify(username, password):
+    # Runs on an auth worker thread
+    try:
+        stored = db2.get_password_hash(username)
+        if not check_password(password, stored):
+            return False
+        if is_legacy_hash(stored):
+            db2.set_password_hash(username, hash_password(password), expected=stored)
+        return True
+    finally:
+        _pending.release()
+
+
+def _hash(password):
+    # Runs on an auth worker thread
+    try:
+        return hash_password(password)
+    finally:
+        _pending.release()
+
+
+def _submit(func, *args):
+    # Queue func on the auth pool; None if MAX_PENDING calls are waiting.
+    # func must release _pending when it is done.
+    if not _pending.acquire(blocking=False):
+        return None
+    try:
+        return _executor.submit(func, *args)
+    except Exception:
+        _pending.release()
+        raise
+
+
+def submit_verify(username, password):
+    """Queue a password check on the auth pool; None if the queue is full."""
+    return _submit(_verify, username, password)
+
+
+def login(username, password, timeout=VERIFY_TIMEOUT):
+    """Check credentials and open a session; returns a LoginResult."""
+    if not limiter.allow(username):
+        return LoginResult(LOGIN_RATE_LIMITED, None)
+    future = submit_verify(username, password)
+    if future is None:
+        return LoginResult(LOGIN_BUSY, None)
+    try:
+        if not future.result(timeout=timeout):
+            return LoginResult(LOGIN_INVALID, None)
+        approved, tenant = db2.get_user_access(username)
+    except (FutureTimeoutError, sqlite3.OperationalError):
+        # The auth pool is backed up or the database is locked
+        return LoginResult(LOGIN_BUSY, None)
+    if not approved:
+        return LoginResult(LOGIN_PENDING, None)
+    return LoginResult(LOGIN_OK, sessions.create(username, tenant), tenant)
+
+
+def register(username, password, timeout=VERIFY_TIMEOUT):
+    """Create a user with a salted hash; returns REGISTER_OK, REGISTER_TAKEN,
+    LOGIN_RATE_LIMITED or LOGIN_BUSY.
+
+    Hashing goes through the same bounded queue as login(). The account
+    cannot log in until tenants.assign_user() (manage.py assign-user)
+    gives it a dealership or group-wide access.
+    """
+    if not registration_limiter.allow(None):
+        return LOGIN_RATE_LIMITED
+    try:
+        if db2.get_password_hash(username) is not None:
+            return REGISTER_TAKEN
+        future = _submit(_hash, password)
+        if future is None:
+            return LOGIN_BUSY
+        added = db2.add_user(username, future.result(timeout=timeout))
+    except (FutureTimeoutError, sqlite3.OperationalError):
+        return LOGIN_BUSY
+    return REGISTER_OK if added else REGISTER_TAKEN
+
+
+def session_user(token):
+    return sessions.get(token)
+
+
+def session_tenant(token):
+    return sessions.tenant(token)
+
+
+def logout(token):
+    sessions.end(token)
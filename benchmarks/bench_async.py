@@ -0,0 +1,102 @@
+"""Sales Dashboard page data: sequential db2 calls against db_async.
+
+Every statement sleeps --delay milliseconds before running, standing in for
+a slow disk (SQLite releases the GIL while it waits on I/O, and so does
+sleep). The read cache is disabled. "sequential" calls the dashboard's five
+reads one after another on the script thread, as the page used to;
+"concurrent" awaits them together through db_async.run(). The older
+get_all_sales() + get_all_cars() pair is timed both ways as well.
+
+    python benchmarks/bench_async.py --delays 0 2 5 10 --sales 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_async
+import db_pool
+import db_trace
+import synthetic
+
+DELAY = 0.0
+
+
+class SlowCursor(db_trace.TracedCursor):
+    def execute(self, sql, parameters=()):
+        time.sleep(DELAY)
+        return super().execute(sql, parameters)
+
+
+class SlowConnection(db_trace.TracedConnection):
+    def cursor(self, factory=SlowCursor):
+        return super().cursor(factory)
+
+
+def dashboard_sequential():
+    return (db2.get_sales_summary(), db2.get_recent_sales(100, columnar=True), db2.get_sales_trend("day"),
+            db2.get_model_sales_counts(), db2.get_manufacturer_average_prices())
+
+
+def dashboard_concurrent():
+    return db_async.run(db_async.get_sales_summary(), db_async.get_recent_sales(100, columnar=True),
+                        db_async.get_sales_trend("day"), db_async.get_model_sales_counts(),
+                        db_async.get_manufacturer_average_prices())
+
+
+def full_sequential():
+    return db2.get_all_sales(), db2.get_all_cars()
+
+
+def full_concurrent():
+    return db_async.run(db_async.get_all_sales(), db_async.get_all_cars())
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    global DELAY
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delays", type=float, nargs="+", default=[0, 2, 5, 10], help="milliseconds per statement")
+    parser.add_argument("--cars", type=int, default=20_000)
+    parser.add_argument("--sales", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "async.db")
+    # Registered before db2 creates the pool, so every connection is slow
+    db_pool.get_pool(db2.DB_PATH, factory=SlowConnection, on_acquire=db_trace.record_wait)
+    db2.init_db()
+    synthetic.generate(cars=args.cars, parts_per_car=1, sales=args.sales, users=0)
+    db2.read_cache.enabled = False
+
+    print(f"{db_async.READ_WORKERS} read workers, {args.cars} cars, {args.sales} sales")
+    print(f"{'delay (ms)':>10} {'page':<18} {'sequential (ms)':>16} {'concurrent (ms)':>16} {'speedup':>8}")
+    for delay in args.delays:
+        DELAY = delay / 1000
+        for page, sequential, concurrent in (("dashboard", dashboard_sequential, dashboard_concurrent),
+                                             ("all sales + cars", full_sequential, full_concurrent)):
+            seq = best_of(sequential, args.repeat)
+            con = best_of(concurrent, args.repeat)
+            print(f"{delay:>10g} {page:<18} {seq * 1000:>16.1f} {con * 1000:>16.1f} {seq / con:>7.1f}x")
+
+    db_pool.close_all()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Time the car selection logic of the Sell Car and Update Car Info pages.
+
+"legacy" replays what the pages did before the inventory index: build the
+label dict, then loop over every car doing a linear next() scan and a spare
+parts query per iteration. It is O(n^2) with n queries, so above
+--legacy-limit iterations the loop is sampled and extrapolated (marked ~).
+
+"indexed" builds an InventoryIndex once per query result, resolves the
+selected label in O(1) and fetches the car with its parts cost in one query.
+
+    python benchmarks/bench_car_selection.py --sizes 1000 10000 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+from inventory import InventoryIndex
+
+
+def populate(cars, seed=3):
+    rng = random.Random(seed)
+    with db2._connect() as conn:
+        conn.executemany(
+            "INSERT INTO cars (manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items) "
+            "VALUES (?, ?, '', ?, 'Manual', 'Petrol', ?, ?, '', '')",
+            ((rng.choice("ABCDEFGH"), rng.choice("abcdefgh"), rng.randrange(100000), f"SEL-{i:07d}",
+              rng.uniform(1000, 50000)) for i in range(cars)))
+        conn.executemany(
+            "INSERT INTO spare_parts (car_id, part_name, cost) VALUES (?, 'part', 25.0)",
+            ((rng.randrange(1, cars + 1),) for _ in range(cars * 2)))
+        conn.commit()
+
+
+def legacy_render(cars, selected_index, limit):
+    # The Sell Car page before the index, with the uncached per-car query
+    car_dict = {f"{car[1]} {car[2]} ({car[7]})": car[0] for car in cars}
+    selected_car = list(car_dict.keys())[selected_index]
+    car_id = car_dict[selected_car]
+
+    start = time.perf_counter()
+    iterations = min(len(cars), limit)
+    for car in cars[:iterations]:
+        car = next(car for car in cars if car[0] == car_id)
+        spare_parts_cost = db2.get_spare_parts_cost.uncached(car[0]) or 0.0
+        total_cost = float(car[8]) + float(spare_parts_cost)
+    loop = (time.perf_counter() - start) * len(cars) / iterations
+    return loop, iterations < len(cars)
+
+
+def indexed_render(cars, selected_index):
+    inventory = InventoryIndex(cars)
+    car_id = inventory.id_by_label[inventory.labels[selected_index]]
+    car = db2.get_car_with_parts_cost.uncached(car_id)
+    return car.total_cost
+
+
+def bench(size, legacy_limit):
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "selection.db")
+    db2.init_db()
+    populate(size)
+    cars = db2.get_all_cars.uncached()
+    # The worst case for a linear scan: the last car in the list
+    selected = len(cars) - 1
+
+    start = time.perf_counter()
+    car_dict = {f"{car[1]} {car[2]} ({car[7]})": car[0] for car in cars}
+    labels_time = time.perf_counter() - start
+    loop_time, estimated = legacy_render(cars, selected, legacy_limit)
+    legacy = labels_time + loop_time
+
+    start = time.perf_counter()
+    indexed_render(cars, selected)
+    indexed = time.perf_counter() - start
+
+    # Reruns reuse the cached index, leaving only the O(1) lookup and one query
+    inventory = InventoryIndex(cars)
+    start = time.perf_counter()
+    car_id = inventory.id_by_label[inventory.labels[selected]]
+    db2.get_car_with_parts_cost.uncached(car_id)
+    rerun = time.perf_counter() - start
+
+    db_pool.close_all()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+    return legacy, estimated, indexed, rerun
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--legacy-limit", type=int, default=500,
+                        help="legacy loop iterations to time before extrapolating")
+    args = parser.parse_args()
+
+    print(f"{'cars':>8} {'legacy (ms)':>14} {'indexed (ms)':>13} {'cached rerun (ms)':>18} {'speedup':>9}")
+    for size in args.sizes:
+        legacy, estimated, indexed, rerun = bench(size, args.legacy_limit)
+        marker = "~" if estimated else " "
+        print(f"{size:>8} {marker}{legacy * 1000:>13.1f} {indexed * 1000:>13.2f} {rerun * 1000:>18.3f} "
+              f"{legacy / indexed:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Rerun cost of the View Inventory page: re-reading vs the change feed.
+
+After a handful of edits, "re-read" recomputes the filter options and
+unfiltered totals in SQL (what the page did while the read cache was
+invalidated by any write) and "full reload" re-reads every car with its
+parts cost. "snapshot" is InventorySnapshot.refresh(), which applies
+db2.changes_since() and re-reads only the changed cars. The read cache is
+disabled throughout.
+
+    python benchmarks/bench_change_feed.py --cars 100000 --edits 0 1 5 20
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+import synthetic
+from snapshots import InventorySnapshot
+
+
+def edit(rng, cars, count):
+    for _ in range(count):
+        car_id = rng.randrange(1, cars + 1)
+        if rng.random() < 0.5:
+            car = db2.get_car_by_id(car_id)
+            if car:
+                db2.update_car(car.id, car.manufacture, car.model, car.specification, car.kilometers + 1,
+                               car.gear_type, car.fuel, car.price + 1, car.color, car.extra_items)
+        else:
+            db2.add_spare_part(car_id, "Bench part", 10.0)
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=100_000)
+    parser.add_argument("--edits", type=int, nargs="+", default=[0, 1, 5, 20])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "feed.db")
+    db2.init_db()
+    synthetic.generate(cars=args.cars, parts_per_car=2, sales=0, users=0)
+    db2.read_cache.enabled = False
+    rng = random.Random(7)
+
+    snapshot = InventorySnapshot()
+    tracemalloc.start()
+    initial = timed(snapshot.refresh)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{args.cars} cars; first snapshot load {initial * 1000:.0f} ms, {peak / 1e6:.0f} MB per session")
+
+    print(f"{'edits':>6} {'re-read (ms)':>13} {'full reload (ms)':>17} {'snapshot (ms)':>14} {'cars re-read':>13}")
+    for count in args.edits:
+        reread, reload, refresh, reread_cars = [], [], [], 0
+        for _ in range(args.repeat):
+            edit(rng, args.cars, count)
+            reread.append(timed(lambda: (db2.get_car_filter_options(), db2.get_inventory_totals({}))))
+            reload.append(timed(db2.get_car_with_spare_parts))
+            before = snapshot.cars_reloaded
+            refresh.append(timed(snapshot.refresh))
+            reread_cars += snapshot.cars_reloaded - before
+        print(f"{count:>6} {min(reread) * 1000:>13.1f} {min(reload) * 1000:>17.1f} {min(refresh) * 1000:>14.3f} "
+              f"{reread_cars / args.repeat:>13.1f}")
+
+    # The snapshot must match what a fresh load sees
+    fresh = InventorySnapshot()
+    fresh.refresh()
+    assert fresh.cars == snapshot.cars and abs(fresh.total_cost - snapshot.total_cost) < 1e-3
+
+    db_pool.close_all()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Time the hot lookup queries before and after the index migration.
+
+Each size is loaded into a fresh database with only the base tables
+(schema version 0), queried, then migrated with init_db() and queried again.
+
+    python benchmarks/bench_indexes.py --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+
+MANUFACTURERS = ["Toyota", "Ford", "BMW", "Honda", "Audi", "Kia", "Tesla", "Fiat"]
+MODELS = ["A", "B", "C", "D", "E", "F", "G", "H"]
+
+
+def populate(rows, seed=42):
+    rng = random.Random(seed)
+    with db2._connect() as conn:
+        conn.executemany(
+            "INSERT INTO cars (manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items) "
+            "VALUES (?, ?, '', ?, 'Manual', 'Petrol', ?, ?, 'Black', '')",
+            ((rng.choice(MANUFACTURERS), rng.choice(MODELS), rng.randrange(200000),
+              f"PL-{i:08d}", rng.uniform(1000, 50000)) for i in range(rows)))
+        conn.executemany(
+            "INSERT INTO spare_parts (car_id, part_name, cost) VALUES (?, 'part', ?)",
+            ((rng.randrange(1, rows + 1), rng.uniform(10, 500)) for _ in range(rows)))
+        conn.executemany(
+            "INSERT INTO sales (car_id, manufacture, model, specification, license_plate, sale_price, sale_cost, sale_date) "
+            "VALUES (?, ?, ?, '', ?, ?, ?, datetime('2020-01-01', ? || ' minutes'))",
+            ((i, rng.choice(MANUFACTURERS), rng.choice(MODELS), f"SL-{i:08d}",
+              rng.uniform(1000, 50000), rng.uniform(1000, 50000), rng.randrange(2_000_000))
+             for i in range(rows)))
+        conn.commit()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_queries(rows, repeat):
+    rng = random.Random(7)
+    car_ids = [rng.randrange(1, rows + 1) for _ in range(repeat)]
+    ids = iter(car_ids * 2)
+
+    def sales_between():
+        with db2._connect() as conn:
+            conn.execute("SELECT COUNT(*), SUM(sale_price) FROM sales WHERE sale_date BETWEEN ? AND ?",
+                         ("2021-03-01", "2021-03-08")).fetchone()
+
+    def sales_for_model():
+        with db2._connect() as conn:
+            conn.execute("SELECT COUNT(*) FROM sales WHERE manufacture = ? AND model = ?",
+                         ("BMW", "C")).fetchone()
+
+    def car_by_plate():
+        with db2._connect() as conn:
+            conn.execute("SELECT id FROM cars WHERE license_plate = ?", (f"PL-{rows // 2:08d}",)).fetchone()
+
+    def delete_missing_parts():
+        # Deletes nothing, but still has to locate the rows for car_id
+        db2.delete_spare_part(-1)
+
+    return {
+        "get_spare_parts_cost": timed(lambda: db2.get_spare_parts_cost(next(ids)), repeat),
+        "delete_spare_part": timed(delete_missing_parts, repeat),
+        "get_car_with_spare_parts": timed(db2.get_car_with_spare_parts, 1),
+        "sales_by_date_range": timed(sales_between, repeat),
+        "sales_by_manufacture_model": timed(sales_for_model, repeat),
+        "car_by_license_plate": timed(car_by_plate, repeat),
+    }
+
+
+def bench(rows, repeat):
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, f"bench_{rows}.db")
+
+    # Base tables only: pretend no migration has run yet
+    saved, db2.MIGRATIONS = db2.MIGRATIONS, []
+    db2.SCHEMA_VERSION = 0
+    db2.init_db()
+    db2.MIGRATIONS, db2.SCHEMA_VERSION = saved, len(saved)
+
+    populate(rows)
+    before = run_queries(rows, repeat)
+
+    start = time.perf_counter()
+    db2.init_db()
+    migrate_time = time.perf_counter() - start
+    with db2._connect() as conn:
+        conn.execute("ANALYZE")
+    after = run_queries(rows, repeat)
+
+    db_pool.close_all()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+    return before, after, migrate_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9}  {'query':<28} {'before (ms)':>12} {'after (ms)':>12} {'speedup':>9}")
+    for rows in args.sizes:
+        before, after, migrate_time = bench(rows, args.repeat)
+        for name in before:
+            speedup = before[name] / after[name] if after[name] else float("inf")
+            print(f"{rows:>9}  {name:<28} {before[name] * 1000:>12.3f} {after[name] * 1000:>12.3f} {speedup:>8.1f}x")
+        print(f"{rows:>9}  {'(index migration)':<28} {migrate_time * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Login throughput and latency under concurrent load.
+
+Simulated sessions log in concurrently through auth.login() for a fixed
+duration, for several auth pool sizes. Each session uses its own account, so
+the per-username rate limiter does not interfere; a final run sends a burst
+of attempts at one account to show the limiter shedding them.
+
+A ticker thread stands in for other Streamlit script threads and records
+how late it wakes up; the KDF runs with the GIL released, so this stays low.
+
+    python benchmarks/bench_logins.py --sessions 32 --duration 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import db2
+import db_pool
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def ticker(stop, lateness, interval=0.01):
+    while not stop.is_set():
+        start = time.perf_counter()
+        time.sleep(interval)
+        lateness.append(time.perf_counter() - start - interval)
+
+
+def run(sessions, duration, workers, same_user=False):
+    auth._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth")
+    auth.limiter = auth.TokenBucket()
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    stop = threading.Event()
+    lateness = []
+
+    def session(n):
+        username = "user0" if same_user else f"user{n}"
+        while not stop.is_set():
+            start = time.perf_counter()
+            result = auth.login(username, "correct horse")
+            elapsed = time.perf_counter() - start
+            with lock:
+                statuses[result.status] = statuses.get(result.status, 0) + 1
+                if result.status == auth.LOGIN_OK:
+                    latencies.append(elapsed)
+            if result.status != auth.LOGIN_OK:
+                time.sleep(0.001)
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(sessions)]
+    threads.append(threading.Thread(target=ticker, args=(stop, lateness)))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    auth._executor.shutdown()
+    return latencies, statuses, lateness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "logins.db")
+    db2.init_db()
+    password_hash = auth.hash_password("correct horse")
+    for n in range(args.sessions):
+        db2.add_user(f"user{n}", password_hash, approved=True)
+
+    start = time.perf_counter()
+    auth.hash_password("correct horse")
+    print(f"single KDF: {(time.perf_counter() - start) * 1000:.1f} ms, CPUs: {os.cpu_count()}")
+    print(f"{'workers':>7} {'logins/s':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'busy':>6} {'ticker p99 late (ms)':>21}")
+    for workers in args.workers:
+        latencies, statuses, lateness = run(args.sessions, args.duration, workers)
+        print(f"{workers:>7} {len(latencies) / args.duration:>9.1f} {statistics.median(latencies) * 1000:>9.1f} "
+              f"{percentile(latencies, 95) * 1000:>9.1f} {statuses.get(auth.LOGIN_BUSY, 0):>6} "
+              f"{percentile(lateness, 99) * 1000:>21.2f}")
+
+    _, statuses, _ = run(args.sessions, 1.0, max(args.workers), same_user=True)
+    print(f"burst at one account for 1s: {statuses.get(auth.LOGIN_OK, 0)} verified, "
+          f"{statuses.get(auth.LOGIN_RATE_LIMITED, 0)} rate limited")
+
+    db_pool.close_all()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Writer stalls under dashboard load: live reads against the analytics replica.
+
+Writer threads add cars and spare parts while reader threads loop over the
+Sales Dashboard's scans (every sale, every car, the windowed trend and
+per-model and per-manufacturer aggregates) with the read cache disabled.
+"live" runs the readers against the database being written; "replica"
+runs them through db_replica.Replica.reading(), refreshed in the
+background every --max-age / 2 seconds. Both are run with the WAL journal
+the app uses and with a rollback journal, where a reader's shared lock
+blocks commits. A write slower than --stall-ms counts as a stall; writes
+and dashboard passes that failed with "database is locked" are counted
+under "locked".
+
+    python benchmarks/bench_replica.py --sales 200000 --readers 4 --writers 2
+"""
+import argparse
+import contextlib
+import datetime
+import itertools
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+import db_replica
+import db_trace
+import synthetic
+
+_plates = itertools.count()
+
+
+def writer(stop, latencies, errors, car_count):
+    n = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            if n % 2:
+                db2.add_spare_part(1 + n % car_count, "Bench part", 10.0)
+            else:
+                db2.add_car("Bench", "Writer", "", 0, "Manual", "Petrol", f"W{next(_plates)}", 1000.0, "", "")
+        except sqlite3.OperationalError:
+            errors.append(time.perf_counter() - start)
+        else:
+            latencies.append(time.perf_counter() - start)
+        n += 1
+
+
+def reader(stop, replica, reads, errors, start_day, end_day):
+    while not stop.is_set():
+        try:
+            with replica.reading() if replica else contextlib.nullcontext():
+                db2.get_all_sales()
+                db2.get_all_cars()
+                db2.get_sales_trend("day", start_day, end_day)
+                db2.get_model_sales_counts(start_day, end_day)
+                db2.get_manufacturer_average_prices(start_day, end_day)
+        except sqlite3.OperationalError:
+            errors.append(1)
+        else:
+            reads.append(1)
+
+
+def scenario(base, path, journal_mode, use_replica, args):
+    target = sqlite3.connect(path)
+    source = sqlite3.connect(base)
+    source.backup(target)
+    source.close()
+    target.close()
+    db2.DB_PATH = path
+    pool = db_pool.get_pool(path, journal_mode=journal_mode, factory=db_trace.TracedConnection,
+                            on_acquire=db_trace.record_wait)
+    # Switch the copy's journal mode now: leaving WAL needs the file to
+    # itself, and the replica keeps a connection to it open
+    with pool.connection():
+        pass
+
+    replica = refresher = None
+    if use_replica:
+        replica = db_replica.Replica(path, max_age=args.max_age)
+        refresher = db_replica.ReplicaRefresher(replica)
+        refresher.start()
+        replica.path()
+
+    end_day = datetime.date(2026, 1, 1)
+    start_day = end_day - datetime.timedelta(days=365)
+    stop = threading.Event()
+    latencies, errors, reads, read_errors = [], [], [], []
+    threads = [threading.Thread(target=writer, args=(stop, latencies, errors, args.cars)) for _ in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(stop, replica, reads, read_errors, start_day, end_day))
+                for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    refreshes = ""
+    if replica:
+        refresher.stop()
+        stats = replica.stats()
+        refreshes = f"{stats['refreshes']} x {stats['mean_refresh_seconds'] * 1000:.0f} ms"
+        replica.close()
+    db_pool.close_all()
+
+    latencies.sort()
+    stalls = sum(1 for latency in latencies if latency * 1000 > args.stall_ms)
+    return {
+        "writes/s": len(latencies) / args.seconds,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0,
+        "max": latencies[-1] * 1000 if latencies else 0.0,
+        "stalls": stalls,
+        "errors": len(errors),
+        "reads/s": len(reads) / args.seconds,
+        "read errors": len(read_errors),
+        "refreshes": refreshes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=20_000)
+    parser.add_argument("--sales", type=int, default=200_000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10.0, help="per scenario")
+    parser.add_argument("--max-age", type=float, default=5.0, help="replica staleness bound in seconds")
+    parser.add_argument("--stall-ms", type=float, default=100.0)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    base = os.path.join(tmp, "base.db")
+    db2.DB_PATH = base
+    db2.init_db()
+    synthetic.generate(cars=args.cars, parts_per_car=1, sales=args.sales, users=0)
+    db_pool.close_all()
+    db2.read_cache.enabled = False
+
+    print(f"{args.cars} cars, {args.sales} sales, {args.readers} readers, {args.writers} writers, "
+          f"{args.seconds:g} s per scenario, replica max age {args.max_age:g} s")
+    print(f"{'journal':<8} {'reads':<8} {'writes/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'max (ms)':>9} "
+          f"{'stalls':>7} {'locked':>7} {'reads/s':>8} {'locked':>7}  replica refreshes")
+    for n, (journal_mode, use_replica) in enumerate(itertools.product(("WAL", "DELETE"), (False, True))):
+        result = scenario(base, os.path.join(tmp, f"run{n}.db"), journal_mode, use_replica, args)
+        print(f"{journal_mode:<8} {'replica' if use_replica else 'live':<8} {result['writes/s']:>9.0f} "
+              f"{result['p50']:>9.2f} {result['p99']:>9.1f} {result['max']:>9.1f} {result['stalls']:>7} "
+              f"{result['errors']:>7} {result['reads/s']:>8.2f} {result['read errors']:>7}  {result['refreshes']}")
+
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
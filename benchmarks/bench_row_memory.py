@@ -0,0 +1,90 @@
+"""Measure memory and fetch time of car query results by row representation.
+
+Compares plain sqlite3 tuples, models.Car records (__slots__), a regular
+class with a per-instance __dict__, and the columnar result mode. "retained"
+is what the result keeps alive; "peak" includes temporaries while fetching.
+
+    python benchmarks/bench_row_memory.py --cars 100000
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+from models import Car, fetch_columns
+
+
+class DictCar:
+    # The same record without __slots__, for comparison
+    def __init__(self, *values):
+        for name, value in zip(Car.fields, values):
+            setattr(self, name, value)
+
+
+def populate(cars):
+    with db2._connect() as conn:
+        conn.executemany(
+            "INSERT INTO cars (manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            ((f"Make{i % 40}", f"Model{i % 300}", f"Spec {i % 50}", i * 7 % 250000, db2.GEAR_TYPES[i % 2],
+              db2.FUEL_TYPES[i % 3], f"MEM-{i:07d}", 1000.0 + i, f"Color{i % 12}", "")
+             for i in range(cars)))
+        conn.commit()
+
+
+def fetch(mode):
+    with db2._connect() as conn:
+        cursor = conn.cursor()
+        if mode == "Car (__slots__)":
+            cursor.row_factory = Car.row_factory
+        elif mode == "class with __dict__":
+            cursor.row_factory = lambda cursor, row: DictCar(*row)
+        cursor.execute(f"SELECT {', '.join(Car.fields)} FROM cars")
+        if mode == "columnar":
+            return fetch_columns(cursor)
+        return cursor.fetchall()
+
+
+def measure(mode):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fetch(mode)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return retained, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=100_000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "memory.db")
+    db2.init_db()
+    populate(args.cars)
+
+    print(f"{args.cars} cars")
+    print(f"{'representation':<22} {'retained (MB)':>14} {'bytes/car':>10} {'peak (MB)':>10} {'fetch (ms)':>11}")
+    for mode in ("tuple", "Car (__slots__)", "class with __dict__", "columnar"):
+        retained, peak, elapsed = measure(mode)
+        print(f"{mode:<22} {retained / 1e6:>14.1f} {retained / args.cars:>10.0f} {peak / 1e6:>10.1f} {elapsed * 1000:>11.1f}")
+
+    db_pool.close_all()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
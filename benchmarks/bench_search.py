@@ -0,0 +1,83 @@
+"""Car picker latency: full-text search against listing every car.
+
+"list all" is what the car pickers did before search: fetch every car,
+build the "{manufacture} {model} ({license_plate})" labels and leave the
+user to find one; the substring filter over the labels stands in for the
+selectbox's own client-side filtering. "search" is db2.search_cars() with
+the read cache disabled, for a mix of make/model, prefix, multi-word,
+plate and misspelt queries.
+
+    python benchmarks/bench_search.py --cars 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+import synthetic
+
+QUERIES = ["toyota", "cor", "golf blue", "tesla model", "tow bar", "SYN-0004", "SYN-00123456",
+           "mustang red", "tiguann"]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else 0.0
+
+
+def list_all(query):
+    cars = db2.get_all_cars.uncached()
+    labels = [f"{car.manufacture} {car.model} ({car.license_plate})" for car in cars]
+    needle = query.lower()
+    return [label for label in labels if needle in label.lower()][:20]
+
+
+def time_queries(func, repeat):
+    latencies = {}
+    for query in QUERIES:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func(query)
+            times.append(time.perf_counter() - start)
+        latencies[query] = times
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--list-repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "search.db")
+    db2.init_db()
+    start = time.perf_counter()
+    synthetic.generate(cars=args.cars, parts_per_car=0, sales=0, users=0)
+    print(f"generated {args.cars} cars (with the FTS index) in {time.perf_counter() - start:.1f}s")
+
+    searched = time_queries(lambda query: db2.search_cars.uncached(query), args.repeat)
+    listed = time_queries(list_all, args.list_repeat)
+
+    print(f"{'query':<16} {'hits':>5} {'list all p50 (ms)':>18} {'search p50 (ms)':>16} {'search p95 (ms)':>16} {'speedup':>9}")
+    for query in QUERIES:
+        hits = len(db2.search_cars.uncached(query))
+        list_p50, search_p50 = percentile(listed[query], 50), percentile(searched[query], 50)
+        print(f"{query:<16} {hits:>5} {list_p50 * 1000:>18.1f} {search_p50 * 1000:>16.2f} "
+              f"{percentile(searched[query], 95) * 1000:>16.2f} {list_p50 / search_p50:>8.0f}x")
+
+    db_pool.close_all()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+
+
+if __name__ == "__main__":
+    main()
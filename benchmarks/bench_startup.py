@@ -0,0 +1,123 @@
+"""App startup: cold-process import time and per-rerun overhead of each page.
+
+"cold" starts a fresh interpreter in an empty directory and imports app2
+there, as `streamlit run` does on the first request (the script runs in
+bare mode, so it stops at the login page), and reports whether pandas and
+plotly.express were loaded. "reruns" drives app2.py with Streamlit's
+AppTest against a synthetic database: the login page, then every
+main_app() page, timing the first run after switching to a page and the
+median of the reruns that follow. db2.init_db() is timed on its own too.
+
+    python benchmarks/bench_startup.py --cars 20000 --sales 100000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import auth
+import db2
+import db_pool
+import jobs
+import synthetic
+
+APP = os.path.join(ROOT, "app2.py")
+PAGES = ["View Inventory", "Add New Car", "Update Car Info", "Delete Car", "Add Spare Parts", "Sell Car",
+         "Sales Dashboard", "Import / Export", "Jobs", "Metrics"]
+
+COLD = """
+import json, sys, time
+start = time.perf_counter()
+import streamlit
+imported = time.perf_counter()
+import app2
+done = time.perf_counter()
+print(json.dumps({"streamlit": imported - start, "app2": done - imported,
+                  "pandas": "pandas" in sys.modules, "plotly.express": "plotly.express" in sys.modules}))
+"""
+
+
+def cold_start():
+    tmp = tempfile.mkdtemp()
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    # Streamlit warns about bare mode on stderr for every call
+    out = subprocess.run([sys.executable, "-c", COLD], cwd=tmp, env=env, check=True,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout
+    result = json.loads(out)
+    result["process"] = time.perf_counter() - start
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+    return result
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=20_000)
+    parser.add_argument("--sales", type=int, default=100_000)
+    parser.add_argument("--cold-runs", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5, help="reruns timed per page")
+    args = parser.parse_args()
+
+    runs = [cold_start() for _ in range(args.cold_runs)]
+    best = min(runs, key=lambda run: run["process"])
+    print(f"cold start (best of {args.cold_runs}): process {best['process'] * 1000:.0f} ms, "
+          f"import streamlit {best['streamlit'] * 1000:.0f} ms, import app2 {best['app2'] * 1000:.0f} ms; "
+          f"pandas loaded: {best['pandas']}, plotly.express loaded: {best['plotly.express']}")
+
+    # Imported after the cold runs so they are not warmed by this process
+    from streamlit.testing.v1 import AppTest
+
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "startup.db")
+    first_init = timed(db2.init_db)
+    later_init = statistics.median(timed(db2.init_db) for _ in range(100))
+    schema_check = statistics.median(timed(db2._init_schema) for _ in range(100))
+    print(f"init_db: first {first_init * 1000:.1f} ms, later calls {later_init * 1e6:.1f} us "
+          f"(checking the schema version every time would cost {schema_check * 1000:.2f} ms)")
+
+    synthetic.generate(cars=args.cars, parts_per_car=1, sales=args.sales, users=0)
+    print(f"{args.cars} cars, {args.sales} sales")
+    print(f"{'page':<18} {'first run (ms)':>15} {'rerun p50 (ms)':>15}")
+
+    at = AppTest.from_file(APP, default_timeout=120)
+    first = timed(at.run)
+    reruns = [timed(at.run) for _ in range(args.repeat)]
+    print(f"{'Login':<18} {first * 1000:>15.1f} {statistics.median(reruns) * 1000:>15.1f}")
+
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.session_state['authenticated'] = True
+    at.session_state['session_token'] = auth.sessions.create("bench")
+    at.session_state['username'] = "bench"
+    at.run()
+    for page in PAGES:
+        at.sidebar.selectbox[0].select(page)
+        first = timed(at.run)
+        reruns = [timed(at.run) for _ in range(args.repeat)]
+        assert not at.exception, f"{page}: {at.exception[0].value}"
+        print(f"{page:<18} {first * 1000:>15.1f} {statistics.median(reruns) * 1000:>15.1f}")
+
+    jobs.stop()
+    db_pool.close_all()
+    for dirpath, dirnames, filenames in os.walk(tmp, topdown=False):
+        for name in filenames:
+            os.remove(os.path.join(dirpath, name))
+        os.rmdir(dirpath)
+
+
+if __name__ == "__main__":
+    main()
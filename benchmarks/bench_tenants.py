@@ -0,0 +1,144 @@
+"""Dealership shards: aggregate write throughput and fan-out group reports.
+
+--writers threads add cars and spare parts for --seconds, spread over N
+dealership databases (tenants.py); N = 1 puts every writer on the main
+file, as before sharding. Each write is its own transaction. With
+--synchronous FULL every commit waits for fsync, which is where one
+file's single writer lock serialises the most.
+
+The group report is db2.get_model_sales_counts() over a year of sales for
+every shard, called one shard after another and through tenants.fan_out(),
+with the read cache disabled. Fan-out needs more than one core, or I/O to
+overlap: --delay sleeps that many milliseconds before every report
+statement, standing in for a slow disk as in bench_async.py.
+
+    python benchmarks/bench_tenants.py --shards 1 2 4 8 --writers 8
+"""
+import argparse
+import datetime
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+import db_trace
+import synthetic
+import tenants
+
+_plates = itertools.count()
+DELAY = 0.0
+
+
+class SlowCursor(db_trace.TracedCursor):
+    def execute(self, sql, parameters=()):
+        time.sleep(DELAY)
+        return super().execute(sql, parameters)
+
+
+class SlowConnection(db_trace.TracedConnection):
+    def cursor(self, factory=SlowCursor):
+        return super().cursor(factory)
+
+
+def writer(tenant_id, stop, counts):
+    n = 0
+    with tenants.using(tenant_id):
+        while not stop.is_set():
+            if n % 2:
+                db2.add_spare_part(1, "Bench part", 10.0)
+            else:
+                db2.add_car("Bench", "Writer", "", 0, "Manual", "Petrol", f"W{next(_plates)}", 1000.0, "", "")
+            n += 1
+    counts.append(n)
+
+
+def throughput(shard_ids, args):
+    stop = threading.Event()
+    counts = []
+    threads = [threading.Thread(target=writer, args=(shard_ids[i % len(shard_ids)], stop, counts))
+               for i in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / args.seconds
+
+
+def best_of(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    global DELAY
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--synchronous", choices=["OFF", "NORMAL", "FULL"], default="NORMAL",
+                        help="PRAGMA synchronous for every shard (the app uses NORMAL)")
+    parser.add_argument("--sales", type=int, default=50_000, help="per shard, for the group report")
+    parser.add_argument("--delay", type=float, default=0.0, help="milliseconds per report statement")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "main.db")
+    db2.init_db()
+    db2.read_cache.enabled = False
+    dealerships = [f"d{n}" for n in range(max(args.shards))]
+    for tenant_id in dealerships:
+        tenants.add_tenant(tenant_id, f"Dealership {tenant_id}")
+        with tenants.using(tenant_id):
+            synthetic.generate(cars=1000, parts_per_car=1, sales=args.sales, users=0)
+    # Reopen every database with the requested durability
+    db_pool.close_all()
+    for path in [db2.DB_PATH] + [tenants.path(tenant_id) for tenant_id in dealerships]:
+        db_pool.get_pool(path, synchronous=args.synchronous, factory=SlowConnection,
+                         on_acquire=db_trace.record_wait)
+
+    print(f"{args.writers} writers, {args.seconds:g} s per run, synchronous={args.synchronous}")
+    print(f"{'shards':>6} {'writes/s':>9} {'vs 1 file':>10}")
+    baseline = None
+    for count in args.shards:
+        rate = throughput([None] if count == 1 else dealerships[:count], args)
+        baseline = baseline or rate
+        print(f"{count:>6} {rate:>9.0f} {rate / baseline:>9.2f}x")
+
+    end = datetime.date(2026, 1, 1)
+    start = end - datetime.timedelta(days=365)
+
+    def sequential():
+        for tenant_id in dealerships:
+            with tenants.using(tenant_id):
+                db2.get_model_sales_counts(start, end)
+
+    def parallel():
+        tenants.fan_out(db2.get_model_sales_counts, start, end, tenants=dealerships)
+
+    DELAY = args.delay / 1000
+    seq = best_of(sequential, args.repeat)
+    par = best_of(parallel, args.repeat)
+    print(f"group report over {len(dealerships)} shards x {args.sales} sales, {args.delay:g} ms delay, "
+          f"{os.cpu_count()} CPUs: "
+          f"sequential {seq * 1000:.0f} ms, fan-out {par * 1000:.0f} ms ({seq / par:.1f}x)")
+
+    db_pool.close_all()
+    shutil.rmtree(tmp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""Concurrency stress test for db2.sell_car().
+
+Many threads try to sell cars drawn from a small, shared set, so most cars
+are contended by several sellers at once. Afterwards every car must have
+been sold exactly once, with its spare parts removed and the sales rollups
+matching the sales table. Exits non-zero if any invariant is violated.
+
+With --legacy the old add_sale() + delete_car() sequence is run the same
+way, to show the duplicate sales it allows.
+
+    python benchmarks/stress_sell_car.py --cars 500 --threads 16
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+
+
+def setup(cars, parts_per_car):
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "stress.db")
+    db2.init_db()
+    with db2._connect() as conn:
+        conn.executemany(
+            "INSERT INTO cars (manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items) "
+            "VALUES ('Make', ?, '', 0, 'Manual', 'Petrol', ?, 1000.0, '', '')",
+            ((f"M{i % 7}", f"ST-{i:06d}") for i in range(cars)))
+        conn.executemany(
+            "INSERT INTO spare_parts (car_id, part_name, cost) VALUES (?, 'part', 10.0)",
+            ((car_id, ) for car_id in range(1, cars + 1) for _ in range(parts_per_car)))
+        conn.commit()
+    return tmp
+
+
+def sell_legacy(car_id, sale_price):
+    # The flow the Sell Car page used before sell_car(): read, insert, delete
+    car = db2.get_car_by_id.uncached(car_id)
+    if car is None:
+        return db2.SaleResult(db2.SALE_CONFLICT, None, sale_price, None, None)
+    total_cost = car[8] + db2.get_spare_parts_cost.uncached(car_id)
+    db2.add_sale(car_id, car[1], car[2], car[3], car[7], sale_price, total_cost)
+    db2.delete_car(car_id)
+    db2.delete_spare_part(car_id)
+    return db2.SaleResult(db2.SALE_COMPLETED, None, sale_price, total_cost, sale_price - total_cost)
+
+
+def run(cars, threads, attempts, legacy, seed):
+    sell = sell_legacy if legacy else db2.sell_car
+    sold, conflicts, errors = [], [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def seller(n):
+        rng = random.Random(seed + n)
+        barrier.wait()
+        for _ in range(attempts):
+            car_id = rng.randrange(1, cars + 1)
+            try:
+                result = sell(car_id, 1500.0)
+            except Exception as e:
+                with lock:
+                    errors.append(repr(e))
+                continue
+            with lock:
+                (sold if result.status == db2.SALE_COMPLETED else conflicts).append(car_id)
+
+    workers = [threading.Thread(target=seller, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sold, conflicts, errors, time.perf_counter() - start
+
+
+def check(sold):
+    problems = []
+    with db2._connect() as conn:
+        sales = dict(conn.execute("SELECT car_id, COUNT(*) FROM sales GROUP BY car_id").fetchall())
+        duplicated = {car_id: n for car_id, n in sales.items() if n > 1}
+        if duplicated:
+            problems.append(f"{len(duplicated)} cars sold more than once")
+        if len(sold) != len(set(sold)):
+            problems.append(f"{len(sold) - len(set(sold))} sales reported for cars already sold")
+        remaining = conn.execute(
+            f"SELECT COUNT(*) FROM cars WHERE id IN ({', '.join('?' * len(sales))})", list(sales)).fetchone()[0]
+        if remaining:
+            problems.append(f"{remaining} sold cars still in the inventory")
+        orphans = conn.execute("SELECT COUNT(*) FROM spare_parts WHERE car_id NOT IN (SELECT id FROM cars)").fetchone()[0]
+        if orphans:
+            problems.append(f"{orphans} spare parts left for sold cars")
+        total = conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+        rolled_up = conn.execute("SELECT IFNULL(SUM(sales_count), 0) FROM sales_rollup WHERE period = 'day'").fetchone()[0]
+        if total != rolled_up:
+            problems.append(f"rollups count {rolled_up} sales, table has {total}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cars", type=int, default=500)
+    parser.add_argument("--parts-per-car", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--attempts", type=int, default=100, help="sale attempts per thread")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--legacy", action="store_true", help="run the old add_sale + delete_car flow instead")
+    args = parser.parse_args()
+
+    tmp = setup(args.cars, args.parts_per_car)
+    try:
+        sold, conflicts, errors, elapsed = run(args.cars, args.threads, args.attempts, args.legacy, args.seed)
+        problems = check(sold)
+        stats = db2.pool_stats()
+    finally:
+        db_pool.close_all()
+        for name in os.listdir(tmp):
+            os.remove(os.path.join(tmp, name))
+        os.rmdir(tmp)
+
+    attempts = args.threads * args.attempts
+    print(f"flow: {'legacy' if args.legacy else 'sell_car'}, threads: {args.threads}, attempts: {attempts}")
+    print(f"sold: {len(sold)}, conflicts: {len(conflicts)}, errors: {len(errors)}, "
+          f"elapsed: {elapsed:.2f}s, {attempts / elapsed:.0f} attempts/s")
+    print(f"pool waits: {stats['waits']}, max wait: {stats['max_wait'] * 1000:.1f} ms")
+    for error in sorted(set(errors))[:5]:
+        print(f"  error: {error}")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if problems or errors:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""End-to-end benchmark suite for db2 and the data paths of the app pages.
+
+Builds a seeded synthetic database at the chosen scale, then times every
+db2 read and write function plus the data path of each main_app() page.
+Each scenario reports p50/p95/p99 latency, throughput and peak traced
+memory. The read cache is disabled unless --cached is given, so the
+numbers reflect the database work.
+
+    python benchmarks/suite.py --scale medium --json results.json
+    python benchmarks/suite.py --scale medium --compare results.json
+
+With --compare, scenarios whose p95 moved by more than --threshold percent
+against an earlier JSON report are flagged.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+import synthetic
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    rank = (len(values) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (rank - low)
+
+
+def measure(func, iterations, warmup=1):
+    for _ in range(warmup):
+        func()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        t = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - t)
+    total = time.perf_counter() - start
+
+    # One more call under tracemalloc for the peak; it slows the call down,
+    # so it is kept out of the timings above
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": total / iterations * 1000,
+        "throughput_per_s": iterations / total if total else 0.0,
+        "peak_memory_mb": peak / 1e6,
+    }
+
+
+def scenarios(scale, rng):
+    """(name, callable, iterations) for every timed scenario."""
+    cars = scale["cars"]
+    heavy = max(1, min(20, 2_000_000 // max(cars, 1)))
+    plates = iter(f"BENCH-{n:08d}" for n in range(10 ** 8))
+    # Cars reserved for destructive scenarios, taken from the end of the id range
+    victims = iter(range(cars, 0, -1))
+
+    def random_id():
+        return rng.randrange(1, cars // 2 + 1)
+
+    def add_car():
+        db2.add_car("Bench", "Car", "", 1000, "Manual", "Petrol", next(plates), 9999.0, "Black", "")
+
+    def update_car():
+        car = db2.get_car_by_id(random_id())
+        if car:
+            db2.update_car(car.id, car.manufacture, car.model, car.specification, car.kilometers + 1,
+                           car.gear_type, car.fuel, car.price, car.color, car.extra_items)
+
+    def delete_car():
+        car_id = next(victims)
+        db2.delete_car(car_id)
+        db2.delete_spare_part(car_id)
+
+    def page_view_inventory():
+        db2.get_car_filter_options()
+        page, cursor = db2.query_cars({}, sort_by="price", descending=True, limit=25)
+        db2.query_cars({}, sort_by="price", descending=True, after=cursor, limit=25)
+        db2.get_inventory_totals({})
+
+    def page_view_inventory_filtered():
+        filters = {"manufacture": "Toyota", "fuel": "Petrol", "min_price": 10_000, "max_kilometers": 150_000}
+        db2.get_car_filter_options()
+        db2.query_cars(filters, sort_by="kilometers", limit=25)
+        db2.get_inventory_totals(filters)
+
+    def page_sell_car():
+        inventory = db2.get_inventory_index()
+        car = db2.get_car_with_parts_cost(inventory.id_by_label[inventory.labels[-1]])
+        db2.sell_car(car.id, car.total_cost * 1.1)
+
+    def page_update_car():
+        inventory = db2.get_inventory_index()
+        car = inventory.get(inventory.id_by_label[inventory.labels[rng.randrange(len(inventory))]])
+        db2.update_car(car.id, car.manufacture, car.model, car.specification, car.kilometers,
+                       car.gear_type, car.fuel, car.price, car.color, car.extra_items)
+
+    def page_sales_dashboard():
+        db2.get_sales_summary()
+        db2.get_recent_sales(100, columnar=True)
+        db2.get_sales_trend("day")
+        db2.get_model_sales_counts()
+        db2.get_manufacturer_average_prices()
+
+    return [
+        ("db2.get_all_cars", db2.get_all_cars, heavy),
+        ("db2.get_all_cars[columnar]", lambda: db2.get_all_cars(columnar=True), heavy),
+        ("db2.get_car_by_id", lambda: db2.get_car_by_id(random_id()), 500),
+        ("db2.get_spare_parts_cost", lambda: db2.get_spare_parts_cost(random_id()), 500),
+        ("db2.get_spare_parts_by_id", lambda: db2.get_spare_parts_by_id(random_id()), 500),
+        ("db2.get_car_with_parts_cost", lambda: db2.get_car_with_parts_cost(random_id()), 500),
+        ("db2.get_car_with_spare_parts", db2.get_car_with_spare_parts, heavy),
+        ("db2.get_inventory_index", db2.get_inventory_index, heavy),
+        ("db2.query_cars", lambda: db2.query_cars({}, limit=25), 200),
+        ("db2.get_inventory_totals", lambda: db2.get_inventory_totals({}), heavy),
+        ("db2.get_car_filter_options", db2.get_car_filter_options, 50),
+        ("db2.get_sales_data", db2.get_sales_data, heavy),
+        ("db2.get_all_sales", db2.get_all_sales, heavy),
+        ("db2.get_recent_sales", lambda: db2.get_recent_sales(100), 200),
+        ("db2.get_sales_summary", db2.get_sales_summary, 200),
+        ("db2.get_sales_trend[day]", lambda: db2.get_sales_trend("day"), 100),
+        ("db2.get_sales_trend[month]", lambda: db2.get_sales_trend("month"), 200),
+        ("db2.get_model_sales_counts", db2.get_model_sales_counts, 200),
+        ("db2.get_manufacturer_average_prices", db2.get_manufacturer_average_prices, 200),
+        ("db2.get_password_hash", lambda: db2.get_password_hash(f"user{rng.randrange(scale['users'])}"), 500),
+        ("db2.add_car", add_car, 200),
+        ("db2.update_car", update_car, 200),
+        ("db2.add_spare_part", lambda: db2.add_spare_part(random_id(), "Bench part", 10.0), 200),
+        ("db2.add_sale", lambda: db2.add_sale(0, "Bench", "Car", "", "BENCH", 1000.0, 900.0), 200),
+        ("db2.delete_car+delete_spare_part", delete_car, 100),
+        ("page.view_inventory", page_view_inventory, 50),
+        ("page.view_inventory[filtered]", page_view_inventory_filtered, 50),
+        ("page.update_car", page_update_car, 50),
+        ("page.sell_car", page_sell_car, 50),
+        ("page.sales_dashboard", page_sales_dashboard, 50),
+    ]
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nagainst {baseline_path} (p95, threshold {threshold:.0f}%):")
+    regressions = 0
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["p95_ms"], result["p95_ms"]
+        change = (after - before) / before * 100 if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag, regressions = "REGRESSION", regressions + 1
+        elif change < -threshold:
+            flag = "improved"
+        print(f"  {name:<40} {before:>10.3f} -> {after:>10.3f} ms {change:>+7.1f}% {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", choices=sorted(synthetic.SCALES), default="small")
+    parser.add_argument("--cars", type=int)
+    parser.add_argument("--parts-per-car", type=int)
+    parser.add_argument("--sales", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", help="run only scenarios whose name contains this text")
+    parser.add_argument("--cached", action="store_true", help="leave the db2 read cache enabled")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+
+    scale = dict(synthetic.SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+
+    tmp = tempfile.mkdtemp()
+    db2.DB_PATH = os.path.join(tmp, "suite.db")
+    db2.init_db()
+    start = time.perf_counter()
+    synthetic.generate(seed=args.seed, **scale)
+    print(f"generated {scale} in {time.perf_counter() - start:.1f}s")
+    db2.read_cache.enabled = args.cached
+
+    rng = random.Random(args.seed)
+    results = {}
+    print(f"{'scenario':<40} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'ops/s':>9} {'peak MB':>8}")
+    for name, func, iterations in scenarios(scale, rng):
+        if args.only and args.only not in name:
+            continue
+        result = measure(func, iterations)
+        results[name] = result
+        print(f"{name:<40} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+              f"{result['throughput_per_s']:>9.1f} {result['peak_memory_mb']:>8.2f}")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "scale": scale,
+            "seed": args.seed,
+            "cached": args.cached,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "schema_version": db2.get_schema_version(),
+        },
+        "pool": db2.pool_stats(),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.json}")
+
+    db_pool.close_all()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
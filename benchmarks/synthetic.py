@@ -0,0 +1,128 @@
+"""Seeded synthetic data for the car inventory database.
+
+    python benchmarks/synthetic.py out.db --cars 100000 --sales 500000
+
+The same seed and scale always produce the same rows.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import auth
+import db2
+
+CATALOG = {
+    "Toyota": ["Corolla", "Camry", "RAV4", "Yaris", "Prius", "Hilux"],
+    "Ford": ["Focus", "Fiesta", "Mustang", "Kuga", "Ranger"],
+    "BMW": ["320i", "520d", "X1", "X3", "i3"],
+    "Volkswagen": ["Golf", "Polo", "Passat", "Tiguan", "ID.3"],
+    "Honda": ["Civic", "Accord", "CR-V", "Jazz"],
+    "Hyundai": ["i20", "i30", "Tucson", "Kona", "Ioniq"],
+    "Kia": ["Rio", "Ceed", "Sportage", "Niro"],
+    "Tesla": ["Model 3", "Model Y", "Model S"],
+    "Renault": ["Clio", "Megane", "Captur", "Zoe"],
+    "Mercedes": ["A180", "C200", "E220", "GLC"],
+}
+COLORS = ["Black", "White", "Silver", "Grey", "Blue", "Red", "Green"]
+EXTRAS = ["", "", "Tow bar", "Roof rack", "Winter tyres", "Navigation", "Parking sensors"]
+PARTS = ["Brake pads", "Tyre", "Battery", "Oil filter", "Wiper blades", "Headlight", "Mirror", "Clutch kit"]
+
+SCALES = {
+    "small": {"cars": 1_000, "parts_per_car": 3, "sales": 5_000, "users": 20},
+    "medium": {"cars": 20_000, "parts_per_car": 4, "sales": 100_000, "users": 200},
+    "large": {"cars": 200_000, "parts_per_car": 5, "sales": 1_000_000, "users": 2_000},
+}
+
+BATCH = 10_000
+
+
+def _car(rng, n):
+    manufacture = rng.choice(list(CATALOG))
+    fuel = "Electric" if manufacture == "Tesla" else rng.choice(db2.FUEL_TYPES)
+    return (manufacture, rng.choice(CATALOG[manufacture]), f"{rng.choice(['1.0', '1.4', '1.6', '2.0'])} {rng.choice(['Base', 'Comfort', 'Sport'])}",
+            rng.randrange(0, 300_000), rng.choice(db2.GEAR_TYPES), fuel, f"SYN-{n:08d}",
+            round(rng.uniform(2_000, 80_000), 2), rng.choice(COLORS), rng.choice(EXTRAS))
+
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(cars, parts_per_car, sales, users, seed=42, years=5, end=datetime.datetime(2026, 1, 1)):
+    """Fill the database at db2.DB_PATH, which must already be initialised."""
+    rng = random.Random(seed)
+    start = end - datetime.timedelta(days=365 * years)
+    span = int((end - start).total_seconds())
+
+    with db2._connect() as conn:
+        for batch in _batches(_car(rng, n) for n in range(cars)):
+            conn.executemany(
+                "INSERT INTO cars (manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            conn.commit()
+
+        # A varying number of parts per car, averaging parts_per_car
+        parts = ((car_id, rng.choice(PARTS), round(rng.uniform(15, 900), 2))
+                 for car_id in range(1, cars + 1)
+                 for _ in range(rng.randint(0, 2 * parts_per_car)))
+        for batch in _batches(parts):
+            conn.executemany("INSERT INTO spare_parts (car_id, part_name, cost) VALUES (?, ?, ?)", batch)
+            conn.commit()
+
+        # Sold cars are no longer in the inventory, so they get their own ids
+        def sale(n):
+            manufacture, model, specification, _, _, _, plate, price, _, _ = _car(rng, cars + n)
+            cost = price + rng.uniform(0, 2_000)
+            sale_price = round(cost * rng.uniform(0.9, 1.3), 2)
+            when = start + datetime.timedelta(seconds=rng.randrange(span))
+            return (cars + n + 1, manufacture, model, specification, plate, sale_price, round(cost, 2),
+                    when.strftime("%Y-%m-%d %H:%M:%S"))
+
+        for batch in _batches(sale(n) for n in range(sales)):
+            conn.executemany(
+                "INSERT INTO sales (car_id, manufacture, model, specification, license_plate, sale_price, sale_cost, sale_date) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            conn.commit()
+
+        # One real KDF hash shared by every account keeps generation fast
+        password_hash = auth.hash_password("password")
+        conn.executemany("INSERT OR IGNORE INTO users (username, password) VALUES (?, ?)",
+                         ((f"user{n}", password_hash) for n in range(users)))
+        conn.commit()
+    db2._invalidate("cars", "spare_parts", "sales")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--cars", type=int)
+    parser.add_argument("--parts-per-car", type=int)
+    parser.add_argument("--sales", type=int)
+    parser.add_argument("--users", type=int)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    scale = dict(SCALES[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+    db2.DB_PATH = args.db
+    db2.init_db()
+    generate(seed=args.seed, **scale)
+    print(f"wrote {scale} to {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+# bulk.py
+import csv
+import io
+
+import db2
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 50
+
+CAR_COLUMNS = ["manufacture", "model", "specification", "kilometers", "gear_type", "fuel",
+               "license_plate", "price", "color", "extra_items"]
+SPARE_PART_COLUMNS = ["license_plate", "part_name", "cost"]
+
+# Queries streamed by export(), with the column names and types of each row.
+# Inventory rows carry their spare parts cost.
+EXPORTS = {
+    "sales": (
+        [("id", "int"), ("car_id", "int"), ("manufacture", "text"), ("model", "text"),
+         ("specification", "text"), ("license_plate", "text"), ("sale_price", "real"),
+         ("sale_cost", "real"), ("sale_date", "text")],
+        "SELECT id, car_id, manufacture, model, specification, license_plate, "
+        "sale_price, sale_cost, sale_date FROM sales ORDER BY id",
+    ),
+    "inventory": (
+        [("id", "int"), ("manufacture", "text"), ("model", "text"), ("specification", "text"),
+         ("kilometers", "int"), ("gear_type", "text"), ("fuel", "text"), ("license_plate", "text"),
+         ("price", "real"), ("color", "text"), ("extra_items", "text"), ("spare_parts_cost", "real")],
+        "SELECT c.id, c.manufacture, c.model, c.specification, c.kilometers, c.gear_type, c.fuel, "
+        "c.license_plate, c.price, c.color, c.extra_items, "
+        "IFNULL((SELECT SUM(sp.cost) FROM spare_parts sp WHERE sp.car_id = c.id), 0.0) "
+        "FROM cars c ORDER BY c.id",
+    ),
+}
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Parquet support requires pyarrow (pip install pyarrow)") from None
+    return pyarrow
+
+
+def _detect_format(source, fmt):
+    if fmt:
+        return fmt
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    return "parquet" if str(name).lower().endswith(".parquet") else "csv"
+
+
+def read_chunks(source, fmt=None, chunk_size=CHUNK_SIZE):
+    """Yield lists of row dicts from a CSV or Parquet file path or binary file object."""
+    fmt = _detect_format(source, fmt)
+    if fmt == "parquet":
+        pq = _require_pyarrow().parquet
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pylist()
+        return
+
+    if isinstance(source, str):
+        handle = open(source, newline="", encoding="utf-8")
+    else:
+        handle = io.TextIOWrapper(source, encoding="utf-8", newline="")
+    try:
+        chunk = []
+        for row in csv.DictReader(handle):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        if isinstance(source, str):
+            handle.close()
+        else:
+            handle.detach()
+
+
+def _text(row, column, required=False):
+    value = row.get(column)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"{column} is required")
+    return value
+
+
+def _number(row, column, kind):
+    value = row.get(column)
+    try:
+        number = kind(float(value)) if kind is int else kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{column} must be a number, got {value!r}") from None
+    if number < 0:
+        raise ValueError(f"{column} must not be negative")
+    return number
+
+
+def validate_car(row):
+    """Return the cars insert tuple for a row dict, or raise ValueError."""
+    gear_type = _text(row, "gear_type", required=True)
+    if gear_type not in db2.GEAR_TYPES:
+        raise ValueError(f"gear_type must be one of {', '.join(db2.GEAR_TYPES)}")
+    fuel = _text(row, "fuel", required=True)
+    if fuel not in db2.FUEL_TYPES:
+        raise ValueError(f"fuel must be one of {', '.join(db2.FUEL_TYPES)}")
+    return (
+        _text(row, "manufacture", required=True),
+        _text(row, "model", required=True),
+        _text(row, "specification"),
+        _number(row, "kilometers", int),
+        gear_type,
+        fuel,
+        _text(row, "license_plate", required=True),
+        _number(row, "price", float),
+        _text(row, "color"),
+        _text(row, "extra_items"),
+    )
+
+
+def validate_spare_part(row):
+    return (
+        _text(row, "part_name", required=True),
+        _number(row, "cost", float),
+        _text(row, "license_plate", required=True),
+    )
+
+
+def _new_report():
+    return {"rows": 0, "inserted": 0, "duplicates": 0, "invalid": 0, "unmatched": 0, "errors": []}
+
+
+def _reject(report, line, error):
+    report["invalid"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append(f"row {line}: {error}")
+
+
+def _insert_chunk(sql, rows):
+    # One transaction per chunk; returns the number of rows actually inserted.
+    # rowcount, unlike conn.total_changes, leaves out rows written by triggers
+    # (cars_fts, change_log).
+    with db2._connect() as conn:
+        conn.execute("BEGIN")
+        cursor = conn.executemany(sql, rows)
+        conn.commit()
+        return max(cursor.rowcount, 0)
+
+
+def import_cars(source, fmt=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Stream cars into the inventory, skipping invalid rows and known license plates.
+
+    `progress`, if given, is called with the running report after every chunk.
+    """
+    report = _new_report()
+    seen = set()
+    for chunk in read_chunks(source, fmt, chunk_size):
+        rows = []
+        for row in chunk:
+            report["rows"] += 1
+            try:
+                car = validate_car(row)
+            except ValueError as e:
+                _reject(report, report["rows"], e)
+                continue
+            # Plates repeated within the file; the unique index catches the rest
+            if car[6] in seen:
+                report["duplicates"] += 1
+                continue
+            seen.add(car[6])
+            rows.append(car)
+
+        inserted = _insert_chunk(
+            f"INSERT OR IGNORE INTO cars ({', '.join(CAR_COLUMNS)}) VALUES ({', '.join('?' * len(CAR_COLUMNS))})",
+            rows)
+        report["inserted"] += inserted
+        report["duplicates"] += len(rows) - inserted
+        db2._invalidate("cars")
+        if progress:
+            progress(report)
+    return report
+
+
+def import_spare_parts(source, fmt=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Stream spare parts, matched to cars by license plate."""
+    report = _new_report()
+    for chunk in read_chunks(source, fmt, chunk_size):
+        rows = []
+        for row in chunk:
+            report["rows"] += 1
+            try:
+                rows.append(validate_spare_part(row))
+            except ValueError as e:
+                _reject(report, report["rows"], e)
+
+        inserted = _insert_chunk(
+            "INSERT INTO spare_parts (car_id, part_name, cost) "
+            "SELECT id, ?, ? FROM cars WHERE license_plate = ?",
+            rows)
+        report["inserted"] += inserted
+        report["unmatched"] += len(rows) - inserted
+        db2._invalidate("spare_parts")
+        if progress:
+            progress(report)
+    return report
+
+
+def iter_export(name, chunk_size=CHUNK_SIZE):
+    """Yield chunks of export rows without loading the whole table."""
+    sql = EXPORTS[name][1]
+    with db2._connect() as conn:
+        cursor = conn.execute(sql)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+def export(name, destination, fmt=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Write the `sales` or `inventory` export to a path; returns the row count.
+
+    `progress`, if given, is called with the rows written so far after every chunk.
+    """
+    fmt = _detect_format(destination, fmt)
+    columns = EXPORTS[name][0]
+    header = [column for column, _ in columns]
+    count = 0
+
+    if fmt == "parquet":
+        pa = _require_pyarrow()
+        types = {"int": pa.int64(), "real": pa.float64(), "text": pa.string()}
+        schema = pa.schema([(column, types[kind]) for column, kind in columns])
+        with pa.parquet.ParquetWriter(destination, schema) as writer:
+            for rows in iter_export(name, chunk_size):
+                writer.write_table(pa.Table.from_pylist([dict(zip(header, row)) for row in rows], schema=schema))
+                count += len(rows)
+                if progress:
+                    progress(count)
+        return count
+
+    with open(destination, "w", newline="", encoding="utf-8") as f:
+        out = csv.writer(f)
+        out.writerow(header)
+        for rows in iter_export(name, chunk_size):
+            out.writerows(rows)
+            count += len(rows)
+            if progress:
+                progress(count)
+    return count
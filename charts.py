@@ -0,0 +1,55 @@
+# charts.py
+
+# Most points a dashboard series is drawn with, whatever the history length
+MAX_CHART_POINTS = 500
+
+
+def lttb(xs, ys, threshold=MAX_CHART_POINTS):
+    """Indices of at most `threshold` points that keep the shape of a series.
+
+    Largest-Triangle-Three-Buckets: the first and last points are kept, the
+    rest are split into threshold - 2 buckets, and from each bucket the point
+    forming the largest triangle with the previously kept point and the mean
+    of the next bucket is kept. xs must be numeric and ascending.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    kept = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+
+        # Mean of the next bucket (just the last point for the final bucket)
+        next_start, next_end = end, min(int((i + 2) * every) + 1, n)
+        if next_start >= next_end:
+            next_start, next_end = n - 1, n
+        count = next_end - next_start
+        mean_x = sum(xs[next_start:next_end]) / count
+        mean_y = sum(ys[next_start:next_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - mean_x) * (ys[j] - ay) - (ax - xs[j]) * (mean_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def downsample(df, x, y, threshold=MAX_CHART_POINTS):
+    """Rows of `df`, sorted by column x (dates or numbers), thinned with lttb() over column y."""
+    if len(df) <= threshold:
+        return df
+    import pandas as pd
+    xs = df[x]
+    if not pd.api.types.is_numeric_dtype(xs):
+        # Date strings or datetimes, as seconds since the epoch
+        xs = (pd.to_datetime(xs) - pd.Timestamp(0)).dt.total_seconds()
+    return df.iloc[lttb(xs.tolist(), df[y].tolist(), threshold)]
@@ -1,192 +1,1056 @@
 # db2.py
+import contextvars
 import sqlite3
-import hashlib
+from collections import namedtuple
+from contextlib import contextmanager
+import inspect
+import os
+import re
+import threading
+import db_cache
+import db_pool
+import db_trace
+from inventory import InventoryIndex
+from models import Car, InventoryCar, Sale, SparePart, fetch_columns
+
+DB_PATH = "car_inventory.db"
+
+# Allowed values for cars.gear_type and cars.fuel
+GEAR_TYPES = ["Manual", "Automatic"]
+FUEL_TYPES = ["Petrol", "Diesel", "Electric"]
+
+# Shared by every Streamlit session in this process
+read_cache = db_cache.ReadCache()
+
+# Database the current context reads from instead of DB_PATH; see using()
+_db_path = contextvars.ContextVar("db_path", default=None)
+
+def current_path():
+    return _db_path.get() or DB_PATH
+
+@contextmanager
+def using(path):
+    """Point db2 calls made in this block, and db_async calls started from
+    it, at the database `path` instead of DB_PATH."""
+    token = _db_path.set(path)
+    try:
+        yield
+    finally:
+        _db_path.reset(token)
+
+def _pool():
+    # Connections trace their statements and report pool waits to db_trace
+    return db_pool.get_pool(current_path(), factory=db_trace.TracedConnection, on_acquire=db_trace.record_wait)
+
+def _connect():
+    # Borrow a pooled connection for the current database file
+    return _pool().connection()
+
+@contextmanager
+def _connect_main():
+    # Users, dealerships and jobs live in DB_PATH, whichever database the
+    # current context is using
+    with using(DB_PATH), _connect() as conn:
+        yield conn
+
+def pool_stats():
+    return _pool().stats()
+
+def _cached(*tables):
+    # Memoize a read function until one of `tables` is written to
+    return read_cache.cached(*tables, scope=current_path)
+
+def _invalidate(*tables):
+    read_cache.bump(current_path(), *tables)
+
+def cache_stats():
+    return read_cache.stats()
+
+# Buckets of the sales_rollup table, as SQL over a sale date expression
+ROLLUP_PERIODS = {
+    "day": "date({})",
+    "week": "date({}, '-6 days', 'weekday 1')",
+    "month": "strftime('%Y-%m-01', {})",
+}
+
+def _sales_rollup_upserts(row, sign):
+    # Statements applying one sales row (NEW or OLD in a trigger) to every rollup
+    price = f"IFNULL({row}.sale_price, 0)"
+    profit = f"IFNULL({row}.sale_price, 0) - IFNULL({row}.sale_cost, 0)"
+    statements = [
+        f'''INSERT INTO sales_rollup (period, period_start, sales_count, revenue, profit)
+        VALUES ('{period}', {bucket.format(row + ".sale_date")}, {sign}1, {sign}({price}), {sign}({profit}))
+        ON CONFLICT (period, period_start) DO UPDATE SET sales_count = sales_count + excluded.sales_count,
+            revenue = revenue + excluded.revenue, profit = profit + excluded.profit;'''
+        for period, bucket in ROLLUP_PERIODS.items()
+    ]
+    statements.append(f'''INSERT INTO sales_model_rollup (model, sales_count)
+        VALUES ({row}.model, {sign}1)
+        ON CONFLICT (model) DO UPDATE SET sales_count = sales_count + excluded.sales_count;''')
+    statements.append(f'''INSERT INTO sales_manufacturer_rollup (manufacture, sales_count, revenue)
+        VALUES ({row}.manufacture, {sign}1, {sign}({price}))
+        ON CONFLICT (manufacture) DO UPDATE SET sales_count = sales_count + excluded.sales_count,
+            revenue = revenue + excluded.revenue;''')
+    return "\n        ".join(statements)
+
+def _sales_day_rollup_upserts(row, sign):
+    # Statements applying one sales row to the per-day model and
+    # manufacturer rollups, which answer windowed dashboard queries
+    day = ROLLUP_PERIODS["day"].format(row + ".sale_date")
+    return f'''INSERT INTO sales_model_day_rollup (day, model, sales_count)
+        VALUES ({day}, {row}.model, {sign}1)
+        ON CONFLICT (day, model) DO UPDATE SET sales_count = sales_count + excluded.sales_count;
+        INSERT INTO sales_manufacturer_day_rollup (day, manufacture, sales_count, revenue)
+        VALUES ({day}, {row}.manufacture, {sign}1, {sign}(IFNULL({row}.sale_price, 0)))
+        ON CONFLICT (day, manufacture) DO UPDATE SET sales_count = sales_count + excluded.sales_count,
+            revenue = revenue + excluded.revenue;'''
+
+# Recompute every rollup from the sales table
+REBUILD_SALES_ROLLUPS = [
+    "DELETE FROM sales_rollup",
+    "DELETE FROM sales_model_rollup",
+    "DELETE FROM sales_manufacturer_rollup",
+] + [
+    f'''INSERT INTO sales_rollup (period, period_start, sales_count, revenue, profit)
+    SELECT '{period}', {bucket.format("sale_date")}, COUNT(*), SUM(IFNULL(sale_price, 0)),
+           SUM(IFNULL(sale_price, 0) - IFNULL(sale_cost, 0))
+    FROM sales GROUP BY 2'''
+    for period, bucket in ROLLUP_PERIODS.items()
+] + [
+    '''INSERT INTO sales_model_rollup (model, sales_count)
+    SELECT model, COUNT(*) FROM sales GROUP BY model''',
+    '''INSERT INTO sales_manufacturer_rollup (manufacture, sales_count, revenue)
+    SELECT manufacture, COUNT(*), SUM(IFNULL(sale_price, 0)) FROM sales GROUP BY manufacture''',
+]
+
+# The same for the per-day rollups, which came later (migration 10)
+REBUILD_SALES_DAY_ROLLUPS = [
+    "DELETE FROM sales_model_day_rollup",
+    "DELETE FROM sales_manufacturer_day_rollup",
+    f'''INSERT INTO sales_model_day_rollup (day, model, sales_count)
+    SELECT {ROLLUP_PERIODS["day"].format("sale_date")}, model, COUNT(*) FROM sales GROUP BY 1, 2''',
+    f'''INSERT INTO sales_manufacturer_day_rollup (day, manufacture, sales_count, revenue)
+    SELECT {ROLLUP_PERIODS["day"].format("sale_date")}, manufacture, COUNT(*), SUM(IFNULL(sale_price, 0))
+    FROM sales GROUP BY 1, 2''',
+]
+
+# Columns of cars indexed by cars_fts, with their bm25 weights: a hit on the
+# make, model or plate counts for more than one in the free-text columns
+CAR_SEARCH_COLUMNS = ("manufacture", "model", "specification", "color", "extra_items", "license_plate")
+CAR_SEARCH_WEIGHTS = (4.0, 4.0, 1.0, 1.0, 0.5, 8.0)
+
+# Tables recorded in change_log, with the column holding the car each row
+# belongs to
+CHANGE_LOG_TABLES = {"cars": "id", "spare_parts": "car_id", "sales": "car_id"}
+# change_log keeps about the newest CHANGE_LOG_KEEP entries: a trigger
+# prunes it every CHANGE_LOG_PRUNE_EVERY changes
+CHANGE_LOG_KEEP = 100000
+CHANGE_LOG_PRUNE_EVERY = 1000
+
+# Schema migrations, applied in order on top of the base tables created by
+# init_db(). The index of a migration + 1 is the schema version it produces,
+# recorded in PRAGMA user_version. Only ever append to this list.
+MIGRATIONS = [
+    # 1: indexes for the hot lookup paths
+    [
+        "CREATE INDEX IF NOT EXISTS idx_spare_parts_car_id ON spare_parts (car_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_sale_date ON sales (sale_date)",
+        "CREATE INDEX IF NOT EXISTS idx_sales_manufacture_model ON sales (manufacture, model)",
+        # Older versions did not check plates, so a file may hold the same
+        # plate (often a blank one) more than once. The oldest car keeps it;
+        # the others get their id appended, e.g. "AB-123 (42)", so the
+        # index can be built and the clashes are easy to find and fix.
+        '''UPDATE cars SET license_plate = TRIM(license_plate || ' (' || id || ')')
+        WHERE license_plate IS NOT NULL
+          AND id NOT IN (SELECT MIN(id) FROM cars WHERE license_plate IS NOT NULL GROUP BY license_plate)''',
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_cars_license_plate ON cars (license_plate)",
+    ],
+    # 2: filter and sort columns of the paginated inventory query
+    [
+        "CREATE INDEX IF NOT EXISTS idx_cars_manufacture_model ON cars (manufacture, model)",
+        "CREATE INDEX IF NOT EXISTS idx_cars_price ON cars (price)",
+        "CREATE INDEX IF NOT EXISTS idx_cars_kilometers ON cars (kilometers)",
+    ],
+    # 3: sales rollups for the dashboard, maintained by triggers in the same
+    # transaction as the sale itself and backfilled from existing sales
+    [
+        '''CREATE TABLE IF NOT EXISTS sales_rollup (
+            period TEXT,
+            period_start TEXT,
+            sales_count INTEGER,
+            revenue REAL,
+            profit REAL,
+            PRIMARY KEY (period, period_start)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS sales_model_rollup (
+            model TEXT PRIMARY KEY,
+            sales_count INTEGER
+        )''',
+        '''CREATE TABLE IF NOT EXISTS sales_manufacturer_rollup (
+            manufacture TEXT PRIMARY KEY,
+            sales_count INTEGER,
+            revenue REAL
+        )''',
+        f'''CREATE TRIGGER IF NOT EXISTS sales_rollup_insert AFTER INSERT ON sales BEGIN
+        {_sales_rollup_upserts("NEW", "")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS sales_rollup_delete AFTER DELETE ON sales BEGIN
+        {_sales_rollup_upserts("OLD", "-")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS sales_rollup_update AFTER UPDATE ON sales BEGIN
+        {_sales_rollup_upserts("OLD", "-")}
+        {_sales_rollup_upserts("NEW", "")}
+        END''',
+    ] + REBUILD_SALES_ROLLUPS,
+    # 4: full-text index over the searchable car columns for search_cars(),
+    # an external content table over cars kept in sync by triggers
+    [
+        f'''CREATE VIRTUAL TABLE IF NOT EXISTS cars_fts USING fts5 (
+            {", ".join(CAR_SEARCH_COLUMNS)},
+            content='cars', content_rowid='id', prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+        )''',
+        f'''CREATE TRIGGER IF NOT EXISTS cars_fts_insert AFTER INSERT ON cars BEGIN
+            INSERT INTO cars_fts (rowid, {", ".join(CAR_SEARCH_COLUMNS)})
+            VALUES (NEW.id, {", ".join("NEW." + column for column in CAR_SEARCH_COLUMNS)});
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS cars_fts_delete AFTER DELETE ON cars BEGIN
+            INSERT INTO cars_fts (cars_fts, rowid, {", ".join(CAR_SEARCH_COLUMNS)})
+            VALUES ('delete', OLD.id, {", ".join("OLD." + column for column in CAR_SEARCH_COLUMNS)});
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS cars_fts_update AFTER UPDATE ON cars BEGIN
+            INSERT INTO cars_fts (cars_fts, rowid, {", ".join(CAR_SEARCH_COLUMNS)})
+            VALUES ('delete', OLD.id, {", ".join("OLD." + column for column in CAR_SEARCH_COLUMNS)});
+            INSERT INTO cars_fts (rowid, {", ".join(CAR_SEARCH_COLUMNS)})
+            VALUES (NEW.id, {", ".join("NEW." + column for column in CAR_SEARCH_COLUMNS)});
+        END''',
+        "INSERT INTO cars_fts (cars_fts) VALUES ('rebuild')",
+    ],
+    # 5: background jobs run by jobs.py; times are Unix timestamps
+    [
+        '''CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            params TEXT,
+            status TEXT NOT NULL,
+            progress REAL,
+            message TEXT,
+            result TEXT,
+            error TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 1,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            created_by TEXT,
+            created_at REAL,
+            started_at REAL,
+            finished_at REAL,
+            run_after REAL
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)",
+    ],
+    # 6: change feed for changes_since(); AUTOINCREMENT so versions are never
+    # reused, even after the newest entries are pruned
+    [
+        '''CREATE TABLE IF NOT EXISTS change_log (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            car_id INTEGER,
+            op TEXT NOT NULL
+        )''',
+    ] + [
+        f'''CREATE TRIGGER IF NOT EXISTS {table}_change_log_{op} AFTER {op.upper()} ON {table} BEGIN
+            INSERT INTO change_log (table_name, row_id, car_id, op)
+            VALUES ('{table}', {row}.id, {row}.{car_id}, '{op}');
+        END'''
+        for table, car_id in CHANGE_LOG_TABLES.items()
+        for op, row in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD"))
+    ] + [
+        # A spare part moved to another car changes both cars
+        '''CREATE TRIGGER IF NOT EXISTS spare_parts_change_log_move AFTER UPDATE OF car_id ON spare_parts
+        WHEN OLD.car_id IS NOT NEW.car_id BEGIN
+            INSERT INTO change_log (table_name, row_id, car_id, op) VALUES ('spare_parts', OLD.id, OLD.car_id, 'update');
+        END''',
+    ],
+    # 7: dealerships, each with its own database file (see tenants.py), and
+    # the dealership a user belongs to or a job runs for; NULL is this file
+    [
+        '''CREATE TABLE IF NOT EXISTS tenants (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            file TEXT NOT NULL UNIQUE
+        )''',
+        "ALTER TABLE users ADD COLUMN tenant TEXT REFERENCES tenants (id)",
+        "ALTER TABLE jobs ADD COLUMN tenant TEXT",
+    ],
+    # 8: accounts registered in the app have no access until an
+    # administrator assigns them (manage.py assign-user); existing users
+    # keep theirs
+    [
+        "ALTER TABLE users ADD COLUMN approved INTEGER NOT NULL DEFAULT 1",
+    ],
+    # 9: prune change_log as changes come in, from any process, instead of
+    # only when someone runs the vacuum job; the limits are fixed when the
+    # trigger is created
+    [
+        f'''CREATE TRIGGER IF NOT EXISTS change_log_prune AFTER INSERT ON change_log
+        WHEN NEW.version % {CHANGE_LOG_PRUNE_EVERY} = 0 BEGIN
+            DELETE FROM change_log WHERE version <= NEW.version - {CHANGE_LOG_KEEP};
+        END''',
+    ],
+    # 10: sales per model and per manufacturer for each day, so windowed
+    # dashboard charts sum days instead of scanning sales; maintained and
+    # backfilled like the rollups of migration 3
+    [
+        '''CREATE TABLE IF NOT EXISTS sales_model_day_rollup (
+            day TEXT,
+            model TEXT,
+            sales_count INTEGER,
+            PRIMARY KEY (day, model)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS sales_manufacturer_day_rollup (
+            day TEXT,
+            manufacture TEXT,
+            sales_count INTEGER,
+            revenue REAL,
+            PRIMARY KEY (day, manufacture)
+        )''',
+        f'''CREATE TRIGGER IF NOT EXISTS sales_day_rollup_insert AFTER INSERT ON sales BEGIN
+        {_sales_day_rollup_upserts("NEW", "")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS sales_day_rollup_delete AFTER DELETE ON sales BEGIN
+        {_sales_day_rollup_upserts("OLD", "-")}
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS sales_day_rollup_update AFTER UPDATE ON sales BEGIN
+        {_sales_day_rollup_upserts("OLD", "-")}
+        {_sales_day_rollup_upserts("NEW", "")}
+        END''',
+    ] + REBUILD_SALES_DAY_ROLLUPS,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version():
+    with _connect() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _migrate(conn):
+    # BEGIN IMMEDIATE so concurrent processes apply each migration only once
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number in range(version + 1, SCHEMA_VERSION + 1):
+            for statement in MIGRATIONS[number - 1]:
+                try:
+                    conn.execute(statement)
+                except sqlite3.DatabaseError as e:
+                    raise RuntimeError(f"Could not upgrade {current_path()} to schema version {number}: {e}. "
+                                       "The file was left unchanged.") from e
+            conn.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# (absolute path, SCHEMA_VERSION) of every database init_db() has brought up
+# to date in this process. app2 calls init_db() on every Streamlit rerun, so
+# after the first call it is a set lookup instead of a connection and a
+# round of CREATE TABLE IF NOT EXISTS.
+_initialized = set()
+_init_lock = threading.Lock()
 
 def init_db():
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    
-    # Create tables if they don't exist
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS cars (
-        id INTEGER PRIMARY KEY,
-        manufacture TEXT,
-        model TEXT,
-        specification TEXT,
-        kilometers INTEGER,
-        gear_type TEXT,
-        fuel TEXT,
-        license_plate TEXT,
-        price REAL,
-        color TEXT,
-        extra_items TEXT
-    )''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS spare_parts (
-        id INTEGER PRIMARY KEY,
-        car_id INTEGER,
-        part_name TEXT,
-        cost REAL,
-        FOREIGN KEY (car_id) REFERENCES cars (id)
-    )''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS sales (
-        id INTEGER PRIMARY KEY,
-        car_id INTEGER,
-        manufacture TEXT,
-        model TEXT,
-        specification TEXT,
-        license_plate TEXT,
-        sale_price REAL,
-        sale_cost REAL,
-        sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        FOREIGN KEY (car_id) REFERENCES cars (id)
-    )''')
-
-    cursor.execute('''CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE,
-                    password TEXT
-                )''')
-    conn.commit()
-    conn.close()
+    key = (os.path.abspath(current_path()), SCHEMA_VERSION)
+    if key in _initialized:
+        return
+    with _init_lock:
+        if key not in _initialized:
+            _init_schema()
+            _initialized.add(key)
 
+def _init_schema():
+    with _connect() as conn:
+        # Version 0 may be a new file or one from before migrations existed
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version and version >= SCHEMA_VERSION:
+            return
+
+        cursor = conn.cursor()
+
+        # Create tables if they don't exist
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cars (
+            id INTEGER PRIMARY KEY,
+            manufacture TEXT,
+            model TEXT,
+            specification TEXT,
+            kilometers INTEGER,
+            gear_type TEXT,
+            fuel TEXT,
+            license_plate TEXT,
+            price REAL,
+            color TEXT,
+            extra_items TEXT
+        )''')
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS spare_parts (
+            id INTEGER PRIMARY KEY,
+            car_id INTEGER,
+            part_name TEXT,
+            cost REAL,
+            FOREIGN KEY (car_id) REFERENCES cars (id)
+        )''')
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales (
+            id INTEGER PRIMARY KEY,
+            car_id INTEGER,
+            manufacture TEXT,
+            model TEXT,
+            specification TEXT,
+            license_plate TEXT,
+            sale_price REAL,
+            sale_cost REAL,
+            sale_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (car_id) REFERENCES cars (id)
+        )''')
+
+        cursor.execute('''CREATE TABLE IF NOT EXISTS users (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        username TEXT UNIQUE,
+                        password TEXT
+                    )''')
+        conn.commit()
+
+        _migrate(conn)
+
+# Returns False if a car with the same license plate already exists
 def add_car(manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items):
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO cars (manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items))
-    conn.commit()
-    conn.close()
-
-def get_all_cars():
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM cars")
-    cars = cursor.fetchall()
-    conn.close()
-    return cars
+    with _connect() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+            INSERT INTO cars (manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', (manufacture, model, specification, kilometers, gear_type, fuel, license_plate, price, color, extra_items))
+            conn.commit()
+            _invalidate("cars")
+            return True
+        except sqlite3.IntegrityError:
+            return False
 
+# Rows are returned as Car records, or with columnar=True as a dict of
+# column name -> list of values for pandas/Streamlit
+@_cached("cars")
+def get_all_cars(columnar=False):
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(Car.fields)} FROM cars")
+        if columnar:
+            return fetch_columns(cursor)
+        cursor.row_factory = Car.row_factory
+        cars = cursor.fetchall()
+        return cars
+
+# Index over get_all_cars(); cached with it, so it is built once per result
+@_cached("cars")
+def get_inventory_index():
+    return InventoryIndex(get_all_cars())
+
+@_cached("cars")
 def get_car_by_id(car_id):
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM cars WHERE id=?", (car_id,))
-    car = cursor.fetchone()
-    conn.close()
-    return car
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = Car.row_factory
+        cursor.execute(f"SELECT {', '.join(Car.fields)} FROM cars WHERE id=?", (car_id,))
+        car = cursor.fetchone()
+        return car
 
 def update_car(car_id, manufacture, model, specification, kilometers, gear_type, fuel, price, color, extra_items):
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute('''
-    UPDATE cars
-    SET manufacture=?, model=?, specification=?, kilometers=?, gear_type=?, fuel=?, price=?, color=?, extra_items=?
-    WHERE id=?''', (manufacture, model, specification, kilometers, gear_type, fuel, price, color, extra_items, car_id))
-    conn.commit()
-    conn.close()
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE cars
+        SET manufacture=?, model=?, specification=?, kilometers=?, gear_type=?, fuel=?, price=?, color=?, extra_items=?
+        WHERE id=?''', (manufacture, model, specification, kilometers, gear_type, fuel, price, color, extra_items, car_id))
+        conn.commit()
+        _invalidate("cars")
 
 def delete_car(car_id):
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM cars WHERE id=?", (car_id,))
-    conn.commit()
-    conn.close()
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM cars WHERE id=?", (car_id,))
+        conn.commit()
+        _invalidate("cars")
 
 def add_spare_part(car_id, part_name, cost):
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute('''
-    INSERT INTO spare_parts (car_id, part_name, cost)
-    VALUES (?, ?, ?)''', (car_id, part_name, cost))
-    conn.commit()
-    conn.close()
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO spare_parts (car_id, part_name, cost)
+        VALUES (?, ?, ?)''', (car_id, part_name, cost))
+        conn.commit()
+        _invalidate("spare_parts")
 
 def delete_spare_part(car_id):
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM spare_parts WHERE car_id=?", (car_id,))
-    conn.commit()
-    conn.close()
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM spare_parts WHERE car_id=?", (car_id,))
+        conn.commit()
+        _invalidate("spare_parts")
 
+@_cached("spare_parts")
 def get_spare_parts_cost(car_id):
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT SUM(cost) FROM spare_parts WHERE car_id=?", (car_id,))
-    cost = cursor.fetchone()[0]
-    conn.close()
-    return cost if cost else 0.0
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT SUM(cost) FROM spare_parts WHERE car_id=?", (car_id,))
+        cost = cursor.fetchone()[0]
+        return cost if cost else 0.0
 
+@_cached("spare_parts")
 def get_spare_parts_by_id(car_id):
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM spare_parts WHERE car_id=?", (car_id,))
-    car = cursor.fetchone()
-    conn.close()
-    return car
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = SparePart.row_factory
+        cursor.execute(f"SELECT {', '.join(SparePart.fields)} FROM spare_parts WHERE car_id=?", (car_id,))
+        car = cursor.fetchone()
+        return car
 
+@_cached("cars", "spare_parts")
 def get_car_with_spare_parts():
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute('''
-    SELECT c.id, c.manufacture, c.model, c.specification, c.kilometers, c.gear_type, c.fuel,
-           c.license_plate, c.price, c.color, c.extra_items, IFNULL(SUM(sp.cost), 0) as spare_parts_cost
-    FROM cars c
-    LEFT JOIN spare_parts sp ON c.id = sp.car_id
-    GROUP BY c.id
-    ''')
-    cars = cursor.fetchall()
-    conn.close()
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = InventoryCar.row_factory
+        cursor.execute('''
+        SELECT c.id, c.manufacture, c.model, c.specification, c.kilometers, c.gear_type, c.fuel,
+               c.license_plate, c.price, c.color, c.extra_items, IFNULL(SUM(sp.cost), 0) as spare_parts_cost
+        FROM cars c
+        LEFT JOIN spare_parts sp ON c.id = sp.car_id
+        GROUP BY c.id
+        ''')
+        cars = cursor.fetchall()
+        return cars
+
+# One car with its spare parts cost, shaped like a get_car_with_spare_parts() row
+@_cached("cars", "spare_parts")
+def get_car_with_parts_cost(car_id):
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = InventoryCar.row_factory
+        cursor.execute('''
+        SELECT c.id, c.manufacture, c.model, c.specification, c.kilometers, c.gear_type, c.fuel,
+               c.license_plate, c.price, c.color, c.extra_items,
+               IFNULL((SELECT SUM(sp.cost) FROM spare_parts sp WHERE sp.car_id = c.id), 0) as spare_parts_cost
+        FROM cars c
+        WHERE c.id = ?
+        ''', (car_id,))
+        return cursor.fetchone()
+
+# Several cars with their spare parts cost, for refreshing changed rows
+def get_cars_with_parts_cost(car_ids, chunk_size=500):
+    car_ids = list(car_ids)
+    cars = []
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = InventoryCar.row_factory
+        for start in range(0, len(car_ids), chunk_size):
+            chunk = car_ids[start:start + chunk_size]
+            cursor.execute(f'''
+            SELECT c.id, c.manufacture, c.model, c.specification, c.kilometers, c.gear_type, c.fuel,
+                   c.license_plate, c.price, c.color, c.extra_items,
+                   IFNULL((SELECT SUM(sp.cost) FROM spare_parts sp WHERE sp.car_id = c.id), 0) as spare_parts_cost
+            FROM cars c
+            WHERE c.id IN ({', '.join('?' * len(chunk))})
+            ''', chunk)
+            cars.extend(cursor.fetchall())
     return cars
 
+# Columns the inventory can be sorted by. The id is always the tie-breaker
+# so page boundaries are stable.
+CAR_SORT_COLUMNS = ("id", "manufacture", "model", "kilometers", "price")
+
+def _car_filter_clause(filters):
+    # Translate a filters dict into a WHERE clause over cars aliased as c
+    conditions, params = [], []
+    for column in ("manufacture", "model", "fuel", "gear_type"):
+        if filters.get(column):
+            conditions.append(f"c.{column} = ?")
+            params.append(filters[column])
+    for column in ("price", "kilometers"):
+        if filters.get(f"min_{column}") is not None:
+            conditions.append(f"c.{column} >= ?")
+            params.append(filters[f"min_{column}"])
+        if filters.get(f"max_{column}") is not None:
+            conditions.append(f"c.{column} <= ?")
+            params.append(filters[f"max_{column}"])
+    return conditions, params
+
+# Fetch one page of cars with their spare parts cost.
+# filters may hold manufacture, model, fuel, gear_type, min_price, max_price,
+# min_kilometers and max_kilometers. Pass the returned cursor as `after` to
+# get the next page; it is None on the last page.
+@_cached("cars", "spare_parts")
+def query_cars(filters=None, sort_by="id", descending=False, after=None, limit=25):
+    if sort_by not in CAR_SORT_COLUMNS:
+        raise ValueError(f"Cannot sort cars by {sort_by!r}")
+    conditions, params = _car_filter_clause(filters or {})
+
+    op, order = ("<", "DESC") if descending else (">", "ASC")
+    if after is not None:
+        if sort_by == "id":
+            conditions.append(f"c.id {op} ?")
+            params.append(after[1])
+        # SQLite sorts NULLs first, so ascending pages run through the cars
+        # without a value before the rest and descending pages end with them.
+        # The row-value comparison is NULL for those cars, so they need their
+        # own branch.
+        elif after[0] is None:
+            nulls = f"c.{sort_by} IS NULL AND c.id {op} ?"
+            conditions.append(f"(({nulls}) OR c.{sort_by} IS NOT NULL)" if not descending else f"({nulls})")
+            params.append(after[1])
+        else:
+            keyset = f"(c.{sort_by}, c.id) {op} (?, ?)"
+            conditions.append(f"({keyset} OR c.{sort_by} IS NULL)" if descending else keyset)
+            params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order_by = f"c.id {order}" if sort_by == "id" else f"c.{sort_by} {order}, c.id {order}"
+
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = InventoryCar.row_factory
+        cursor.execute(f'''
+        SELECT c.id, c.manufacture, c.model, c.specification, c.kilometers, c.gear_type, c.fuel,
+               c.license_plate, c.price, c.color, c.extra_items,
+               IFNULL((SELECT SUM(sp.cost) FROM spare_parts sp WHERE sp.car_id = c.id), 0) as spare_parts_cost
+        FROM cars c
+        {where}
+        ORDER BY {order_by}
+        LIMIT ?
+        ''', params + [limit + 1])
+        cars = cursor.fetchall()
+
+    next_cursor = None
+    if len(cars) > limit:
+        cars = cars[:limit]
+        last = cars[-1]
+        next_cursor = (getattr(last, sort_by), last.id)
+    return cars, next_cursor
+
+# Number of cars and total cost (price + spare parts) matching the filters
+@_cached("cars", "spare_parts")
+def get_inventory_totals(filters=None):
+    conditions, params = _car_filter_clause(filters or {})
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT COUNT(*),
+               IFNULL(SUM(c.price), 0) + IFNULL(SUM((SELECT SUM(sp.cost) FROM spare_parts sp WHERE sp.car_id = c.id)), 0)
+        FROM cars c
+        {where}
+        ''', params)
+        count, total_cost = cursor.fetchone()
+        return count, total_cost
+
+# Distinct values for the inventory filter widgets
+@_cached("cars")
+def get_car_filter_options():
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT manufacture FROM cars ORDER BY manufacture")
+        manufactures = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT DISTINCT model FROM cars ORDER BY model")
+        models = [row[0] for row in cursor.fetchall()]
+        return manufactures, models
+
+def _search_expression(query, operator, trim=0):
+    # Every word of the query as a quoted prefix term, so user input can
+    # never be parsed as FTS5 syntax; "AB-12" becomes "ab"* AND "12"*.
+    # trim drops up to that many trailing characters from words longer than
+    # three, so "corola" still finds "corolla".
+    words = re.findall(r"\w+", query.lower())
+    terms = [f'"{word[:max(3, len(word) - trim)]}"*' for word in words]
+    return f" {operator} ".join(terms)
+
+# Cars matching every word of `query` as a prefix of a word in any searchable
+# column, best match first. When no car matches all words, cars matching any
+# of them are returned instead, then cars matching any word with its last two
+# characters dropped, so a typo still finds something.
+@_cached("cars")
+def search_cars(query, limit=20):
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = Car.row_factory
+        for operator, trim in (("AND", 0), ("OR", 0), ("OR", 2)):
+            expression = _search_expression(query, operator, trim)
+            if not expression:
+                return []
+            # Rank and limit inside the index before joining the matching cars
+            cursor.execute(f'''
+            SELECT {', '.join("c." + field for field in Car.fields)}
+            FROM (
+                SELECT rowid, bm25(cars_fts, {', '.join(map(str, CAR_SEARCH_WEIGHTS))}) AS score
+                FROM cars_fts WHERE cars_fts MATCH ?
+                ORDER BY score, rowid LIMIT ?
+            ) hits
+            JOIN cars c ON c.id = hits.rowid
+            ORDER BY hits.score, c.id
+            ''', (expression, limit))
+            cars = cursor.fetchall()
+            if cars:
+                return cars
+        return []
+
 def add_sale(car_id, manufacture, model, specification, license_plate, sale_price, sale_cost):
-    conn = sqlite3.connect('car_inventory.db')
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO sales (car_id, manufacture, model, specification, license_plate, sale_price, sale_cost)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (car_id, manufacture, model, specification, license_plate, sale_price, sale_cost))
-    conn.commit()
-    conn.close()
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO sales (car_id, manufacture, model, specification, license_plate, sale_price, sale_cost)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (car_id, manufacture, model, specification, license_plate, sale_price, sale_cost))
+        conn.commit()
+        _invalidate("sales")
+
+# Outcome of sell_car(). status is SALE_COMPLETED, or SALE_CONFLICT when the
+# car was no longer in the inventory (e.g. another session sold it first).
+SaleResult = namedtuple("SaleResult", ["status", "sale_id", "sale_price", "total_cost", "profit"])
+SALE_COMPLETED = "sold"
+SALE_CONFLICT = "conflict"
 
+# Record the sale of a car and remove it and its spare parts from the
+# inventory in one transaction. The cost is read inside the transaction, so
+# it always matches what is deleted.
+def sell_car(car_id, sale_price):
+    with _connect() as conn:
+        cursor = conn.cursor()
+        # Take the write lock up front so two sellers cannot both see the car
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute("SELECT manufacture, model, specification, license_plate, price FROM cars WHERE id=?", (car_id,))
+            car = cursor.fetchone()
+            if car is None:
+                conn.rollback()
+                return SaleResult(SALE_CONFLICT, None, sale_price, None, None)
+            manufacture, model, specification, license_plate, price = car
+
+            cursor.execute("SELECT IFNULL(SUM(cost), 0) FROM spare_parts WHERE car_id=?", (car_id,))
+            total_cost = (price or 0.0) + cursor.fetchone()[0]
+
+            cursor.execute("""
+                INSERT INTO sales (car_id, manufacture, model, specification, license_plate, sale_price, sale_cost)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (car_id, manufacture, model, specification, license_plate, sale_price, total_cost))
+            sale_id = cursor.lastrowid
+            cursor.execute("DELETE FROM spare_parts WHERE car_id=?", (car_id,))
+            cursor.execute("DELETE FROM cars WHERE id=?", (car_id,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    _invalidate("cars", "spare_parts", "sales")
+    return SaleResult(SALE_COMPLETED, sale_id, sale_price, total_cost, sale_price - total_cost)
+
+@_cached("sales")
 def get_sales_data():
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT car_id, sale_price, sale_date FROM sales")
-    sales = cursor.fetchall()
-    conn.close()
-    return sales
-
-def get_all_sales():
-    conn = sqlite3.connect("car_inventory.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM sales")
-    sales = cursor.fetchall()
-    conn.close()
-    return sales
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT car_id, sale_price, sale_date FROM sales")
+        sales = cursor.fetchall()
+        return sales
+
+@_cached("sales")
+def get_all_sales(columnar=False):
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(Sale.fields)} FROM sales")
+        if columnar:
+            return fetch_columns(cursor)
+        cursor.row_factory = Sale.row_factory
+        sales = cursor.fetchall()
+        return sales
+
+# Rebuild the dashboard rollups from scratch, e.g. after restoring sales
+def rebuild_sales_rollups():
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for statement in REBUILD_SALES_ROLLUPS + REBUILD_SALES_DAY_ROLLUPS:
+            conn.execute(statement)
+        conn.commit()
+        _invalidate("sales")
+
+# Widest window, in days, charted per day and per week; anything longer is
+# charted per month. Keeps a trend chart to roughly 100 buckets.
+SALES_PERIOD_MAX_DAYS = {"day": 92, "week": 730}
+
+def sales_period_for(start, end):
+    # Bucket size for a trend chart over start..end (dates, inclusive)
+    days = (end - start).days + 1
+    for period, max_days in SALES_PERIOD_MAX_DAYS.items():
+        if days <= max_days:
+            return period
+    return "month"
+
+def _sale_date_clause(start, end, column="sale_date"):
+    # Conditions limiting a sale date column to start..end, inclusive dates
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(str(start))
+    if end is not None:
+        conditions.append(f"{column} < date(?, '+1 day')")
+        params.append(str(end))
+    return conditions, params
+
+# First and last day with a sale, as 'YYYY-MM-DD' strings, or (None, None)
+@_cached("sales")
+def get_sales_date_range():
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+        SELECT MIN(period_start), MAX(period_start) FROM sales_rollup
+        WHERE period = 'day' AND sales_count > 0
+        """)
+        return cursor.fetchone()
+
+# Reclaim free pages and truncate the write-ahead log; returns the file
+# size in bytes before and after
+def vacuum_db():
+    with _connect() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        before = os.path.getsize(current_path())
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    return before, os.path.getsize(current_path())
+
+# Sales count, revenue and profit per day, week or month, oldest first.
+# start and end (dates, inclusive) limit the buckets to those overlapping them.
+@_cached("sales")
+def get_sales_trend(period="day", start=None, end=None):
+    if period not in ROLLUP_PERIODS:
+        raise ValueError(f"Unknown rollup period {period!r}")
+    conditions, params = ["period = ?", "sales_count > 0"], [period]
+    if start is not None:
+        conditions.append(f"period_start >= {ROLLUP_PERIODS[period].format('?')}")
+        params.append(str(start))
+    if end is not None:
+        conditions.append("period_start <= ?")
+        params.append(str(end))
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT period_start, sales_count, revenue, profit FROM sales_rollup
+        WHERE {' AND '.join(conditions)}
+        ORDER BY period_start
+        ''', params)
+        return cursor.fetchall()
+
+# Number of sales, total revenue and total profit over all time, or over the
+# days start..end
+@_cached("sales")
+def get_sales_summary(start=None, end=None):
+    period = "month" if start is None and end is None else "day"
+    conditions, params = _sale_date_clause(start, end, column="period_start")
+    where = "".join(f" AND {condition}" for condition in conditions)
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+        SELECT IFNULL(SUM(sales_count), 0), IFNULL(SUM(revenue), 0), IFNULL(SUM(profit), 0)
+        FROM sales_rollup WHERE period = ?{where}
+        ''', [period] + params)
+        return cursor.fetchone()
+
+# Sales per model, best sellers first. Over all time this reads the rollup;
+# a date window sums the per-day rollup over its days.
+@_cached("sales")
+def get_model_sales_counts(start=None, end=None, limit=None):
+    with _connect() as conn:
+        cursor = conn.cursor()
+        if start is None and end is None:
+            cursor.execute('''
+            SELECT model, sales_count FROM sales_model_rollup
+            WHERE sales_count > 0 ORDER BY sales_count DESC, model
+            LIMIT ?
+            ''', (-1 if limit is None else limit,))
+        else:
+            conditions, params = _sale_date_clause(start, end, column="day")
+            cursor.execute(f'''
+            SELECT model, SUM(sales_count) FROM sales_model_day_rollup
+            WHERE {' AND '.join(conditions)}
+            GROUP BY model HAVING SUM(sales_count) > 0 ORDER BY 2 DESC, model
+            LIMIT ?
+            ''', params + [-1 if limit is None else limit])
+        return cursor.fetchall()
+
+@_cached("sales")
+def get_manufacturer_average_prices(start=None, end=None):
+    with _connect() as conn:
+        cursor = conn.cursor()
+        if start is None and end is None:
+            cursor.execute('''
+            SELECT manufacture, revenue / sales_count FROM sales_manufacturer_rollup
+            WHERE sales_count > 0 ORDER BY manufacture
+            ''')
+        else:
+            conditions, params = _sale_date_clause(start, end, column="day")
+            cursor.execute(f'''
+            SELECT manufacture, SUM(revenue) / SUM(sales_count) FROM sales_manufacturer_day_rollup
+            WHERE {' AND '.join(conditions)}
+            GROUP BY manufacture HAVING SUM(sales_count) > 0 ORDER BY manufacture
+            ''', params)
+        return cursor.fetchall()
+
+# One page of sales between start and end (dates, inclusive), newest first.
+# Pass the returned cursor as `before` for the next page; it is None on the
+# last page.
+@_cached("sales")
+def get_sales_page(start=None, end=None, before=None, limit=50):
+    conditions, params = _sale_date_clause(start, end)
+    if before is not None:
+        conditions.append("(sale_date, id) < (?, ?)")
+        params.extend(before)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = Sale.row_factory
+        cursor.execute(f'''
+        SELECT {', '.join(Sale.fields)} FROM sales
+        {where}
+        ORDER BY sale_date DESC, id DESC
+        LIMIT ?
+        ''', params + [limit + 1])
+        sales = cursor.fetchall()
+
+    next_cursor = None
+    if len(sales) > limit:
+        sales = sales[:limit]
+        next_cursor = (sales[-1].sale_date, sales[-1].id)
+    return sales, next_cursor
+
+# Latest sales, newest first
+@_cached("sales")
+def get_recent_sales(limit=100, columnar=False):
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(Sale.fields)} FROM sales ORDER BY id DESC LIMIT ?", (limit,))
+        if columnar:
+            return fetch_columns(cursor)
+        cursor.row_factory = Sale.row_factory
+        return cursor.fetchall()
+
+# Change feed. Every insert, update and delete on cars, spare_parts and sales
+# appends a row to change_log. A reader remembers the version it has seen and
+# asks for what changed after it. complete is False when the changes can no
+# longer be replayed (older entries were pruned, or there are more than
+# `limit` of them); the reader should then reload from scratch.
+Change = namedtuple("Change", ["version", "table_name", "row_id", "car_id", "op"])
+ChangeSet = namedtuple("ChangeSet", ["version", "changes", "complete"])
+CHANGE_FEED_LIMIT = 10000
+
+def get_change_version():
+    with _connect() as conn:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        return row[0] if row else 0
+
+def changes_since(version, tables=None, limit=CHANGE_FEED_LIMIT):
+    tables = tuple(tables or CHANGE_LOG_TABLES)
+    with _connect() as conn:
+        cursor = conn.cursor()
+        # One read transaction, so the version and the changes agree
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'")
+            row = cursor.fetchone()
+            current = row[0] if row else 0
+            if version >= current:
+                return ChangeSet(current, [], True)
+            cursor.execute("SELECT MIN(version) FROM change_log")
+            oldest = cursor.fetchone()[0]
+            if oldest is None or oldest > version + 1:
+                return ChangeSet(current, [], False)
+            cursor.execute(f'''
+            SELECT version, table_name, row_id, car_id, op FROM change_log
+            WHERE version > ? AND table_name IN ({', '.join('?' * len(tables))})
+            ORDER BY version LIMIT ?
+            ''', (version, *tables, limit + 1))
+            changes = [Change(*row) for row in cursor.fetchall()]
+        finally:
+            conn.rollback()
+    if len(changes) > limit:
+        return ChangeSet(current, [], False)
+    return ChangeSet(current, changes, True)
+
+# Drop all but the newest `keep` change log entries; readers further behind
+# reload from scratch
+def prune_change_log(keep=CHANGE_LOG_KEEP):
+    with _connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM change_log WHERE version <= (SELECT MAX(version) FROM change_log) - ?", (keep,))
+        conn.commit()
+        return cursor.rowcount
+
+# Password hashing and login live in auth.py; these only store the hashes
+# Users are not approved until set_user_tenant() is called for them
+def add_user(username, password_hash, tenant=None, approved=False):
+    with _connect_main() as conn:
+        c = conn.cursor()
+        try:
+            c.execute("INSERT INTO users (username, password, tenant, approved) VALUES (?, ?, ?, ?)",
+                      (username, password_hash, tenant, int(approved)))
+            conn.commit()
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+def get_password_hash(username):
+    with _connect_main() as conn:
+        c = conn.cursor()
+        c.execute("SELECT password FROM users WHERE username = ?", (username,))
+        result = c.fetchone()
+        return result[0] if result else None
+
+# (approved, tenant) for a user, where tenant is the dealership they work
+# for or None for a group-wide user; None if there is no such user
+def get_user_access(username):
+    with _connect_main() as conn:
+        c = conn.cursor()
+        c.execute("SELECT approved, tenant FROM users WHERE username = ?", (username,))
+        result = c.fetchone()
+        return (bool(result[0]), result[1]) if result else None
+
+# Assign a user to a dealership (None for group-wide) and approve them;
+# returns False if there is no such user
+def set_user_tenant(username, tenant):
+    with _connect_main() as conn:
+        c = conn.cursor()
+        c.execute("UPDATE users SET tenant = ?, approved = 1 WHERE username = ?", (tenant, username))
+        conn.commit()
+        return c.rowcount == 1
+
+# Replace a user's hash, only if it still equals `expected` when given
+def set_password_hash(username, password_hash, expected=None):
+    with _connect_main() as conn:
+        c = conn.cursor()
+        if expected is None:
+            c.execute("UPDATE users SET password = ? WHERE username = ?", (password_hash, username))
+        else:
+            c.execute("UPDATE users SET password = ? WHERE username = ? AND password = ?",
+                      (password_hash, username, expected))
+        conn.commit()
+        return c.rowcount == 1
 
 # Register new user with hashed password
 def register_user(username, password):
-    conn = sqlite3.connect('car_inventory.db')
-    c = conn.cursor()
-    hashed_password = hashlib.sha256(password.encode()).hexdigest()
-    try:
-        c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-    finally:
-        conn.close()
+    import auth
+    return auth.register(username, password) == auth.REGISTER_OK
 
 # Verify user credentials
 def verify_user(username, password):
-    conn = sqlite3.connect('car_inventory.db')
-    c = conn.cursor()
-    hashed_password = hashlib.sha256(password.encode()).hexdigest()
-    c.execute("SELECT * FROM users WHERE username = ? AND password = ?", (username, hashed_password))
-    result = c.fetchone()
-    conn.close()
-    return result is not None
\ No newline at end of file
+    import auth
+    return auth.login(username, password).status == auth.LOGIN_OK
+
+# Time every public function; see db_trace and the Metrics page. Routing
+# helpers run on every call and are left alone.
+for _name, _func in list(globals().items()):
+    if (inspect.isfunction(_func) and _func.__module__ == __name__ and not _name.startswith("_")
+            and _name not in ("current_path", "using")):
+        globals()[_name] = db_trace.traced(_func)
+del _name, _func
@@ -0,0 +1,73 @@
+# db_async.py
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import db2
+
+# Threads that run db2 reads for coroutines. Each borrows its own pooled
+# connection for the length of a call, so keep this below
+# db_pool.POOL_SIZE to leave connections for the Streamlit script threads.
+READ_WORKERS = 4
+
+_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="db-read")
+
+# db2 functions that only read, exposed below as coroutine functions
+READ_FUNCTIONS = [
+    "get_all_cars",
+    "get_inventory_index",
+    "get_car_by_id",
+    "get_spare_parts_cost",
+    "get_spare_parts_by_id",
+    "get_car_with_spare_parts",
+    "get_car_with_parts_cost",
+    "query_cars",
+    "get_inventory_totals",
+    "get_car_filter_options",
+    "search_cars",
+    "get_sales_data",
+    "get_sales_date_range",
+    "get_sales_page",
+    "get_all_sales",
+    "get_sales_trend",
+    "get_sales_summary",
+    "get_model_sales_counts",
+    "get_manufacturer_average_prices",
+    "get_recent_sales",
+]
+
+
+async def call(func, *args, **kwargs):
+    """Run a blocking db2 function on the read executor and await its result."""
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context variables over to the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def _async_read(name):
+    @functools.wraps(getattr(db2, name))
+    async def read(*args, **kwargs):
+        # Looked up on every call so tests and tools can swap db2 functions
+        return await call(getattr(db2, name), *args, **kwargs)
+    return read
+
+
+for _name in READ_FUNCTIONS:
+    globals()[_name] = _async_read(_name)
+del _name
+
+
+async def gather(*awaitables):
+    """Await several reads concurrently; results come back in argument order."""
+    return await asyncio.gather(*awaitables)
+
+
+def run(*awaitables):
+    """gather() from synchronous code such as a Streamlit script.
+
+        summary, trend = db_async.run(db_async.get_sales_summary(),
+                                      db_async.get_sales_trend("day"))
+    """
+    return asyncio.run(gather(*awaitables))
@@ -0,0 +1,113 @@
+# db_cache.py
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+CACHE_SIZE = 256
+CACHE_TTL = 30.0
+
+
+def _freeze(value):
+    # Turn dict/list arguments into something hashable for the cache key
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class ReadCache:
+    """Process-wide memo cache for read queries with TTL and LRU eviction.
+
+    Every table has a generation counter per database. A cached entry is keyed
+    on the generations of the tables it was read from, so bumping a table
+    after a write makes all entries that depend on it unreachable; they are
+    never served again and age out through the LRU. The TTL bounds staleness
+    for writes made by other processes, which cannot bump our counters.
+
+    Cached values are shared by every caller and must be treated as read-only.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def generation(self, scope, table):
+        return self._generations.get((scope, table), 0)
+
+    def bump(self, scope, *tables):
+        with self._lock:
+            for table in tables:
+                key = (scope, table)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return True, value
+                del self._entries[key]
+            self._misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def cached(self, *tables, scope=lambda: None):
+        """Decorator memoizing a read function that depends on `tables`.
+
+        `scope` is called on every lookup and identifies the database the
+        function currently reads from.
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                current = scope()
+                key = (func.__qualname__, current, _freeze(args), _freeze(kwargs),
+                       tuple(self.generation(current, table) for table in tables))
+                found, value = self.get(key)
+                if found:
+                    return value
+                value = func(*args, **kwargs)
+                self.put(key, value)
+                return value
+            wrapper.uncached = func
+            return wrapper
+        return decorator
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+            }
@@ -0,0 +1,170 @@
+# db_pool.py
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Per-connection settings, applied once when a connection is opened
+JOURNAL_MODE = "WAL"
+SYNCHRONOUS = "NORMAL"
+BUSY_TIMEOUT_MS = 5000
+POOL_SIZE = 8
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections for one database file.
+
+    A thread checks a connection out for the duration of a `with
+    pool.connection()` block. Nested blocks on the same thread reuse the
+    connection it already holds, so helpers can call each other freely.
+    At most `max_size` connections exist; further threads wait for one to
+    be returned.
+
+    `factory` is the sqlite3.Connection subclass to open, and `on_acquire`,
+    if given, is called with the seconds each checkout waited for a slot.
+    `path` may be a "file:" URI. A `read_only` pool leaves the journal mode
+    alone and rejects writes with PRAGMA query_only.
+    """
+
+    def __init__(self, path, max_size=POOL_SIZE, busy_timeout_ms=BUSY_TIMEOUT_MS,
+                 journal_mode=JOURNAL_MODE, synchronous=SYNCHRONOUS,
+                 factory=sqlite3.Connection, on_acquire=None, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.max_size = max_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.factory = factory
+        self.on_acquire = on_acquire
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = []
+        self._all = set()
+        self._local = threading.local()
+
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait = 0.0
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0,
+                               check_same_thread=False, factory=self.factory, uri=self.path.startswith("file:"))
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        if self.read_only:
+            conn.execute("PRAGMA query_only = ON")
+        elif self.path != ":memory:":
+            conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        return conn
+
+    def _acquire(self):
+        start = time.perf_counter()
+        waited = 0.0
+        if not self._slots.acquire(blocking=False):
+            self._slots.acquire()
+            waited = time.perf_counter() - start
+            with self._lock:
+                self._waits += 1
+                self._wait_time += waited
+                self._max_wait = max(self._max_wait, waited)
+        if self.on_acquire is not None:
+            self.on_acquire(waited)
+
+        with self._lock:
+            if self._idle:
+                self._hits += 1
+                return self._idle.pop()
+            self._misses += 1
+
+        try:
+            conn = self._open()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._all.add(conn)
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            if conn in self._all:
+                self._idle.append(conn)
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self._acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                # Never hand a connection with an open transaction to another thread
+                conn.rollback()
+            self._release(conn)
+
+    def stats(self):
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                "path": self.path,
+                "max_size": self.max_size,
+                "open": len(self._all),
+                "idle": len(self._idle),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / requests if requests else 0.0,
+                "waits": self._waits,
+                "wait_time": self._wait_time,
+                "max_wait": self._max_wait,
+            }
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            for conn in idle:
+                self._all.discard(conn)
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path, **kwargs):
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = ConnectionPool(path, **kwargs)
+                _pools[path] = pool
+    return pool
+
+
+def close_pool(path):
+    """Forget the pool for `path` and close its idle connections; connections
+    still checked out are closed when they are garbage collected."""
+    with _pools_lock:
+        pool = _pools.pop(path, None)
+    if pool is not None:
+        pool.close()
+
+
+def close_all():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,323 @@
+# db_replica.py
+import itertools
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import db2
+import db_pool
+import db_trace
+
+# Most seconds a read served by the replica may lag behind the live database
+MAX_AGE = 60.0
+# Keep replicas in memory rather than in files next to the database
+IN_MEMORY = False
+
+_names = itertools.count(1)
+
+
+class _Generation:
+    # One copy of the source. `uri` is what db2 connects to; `keeper` holds
+    # an in-memory copy open; `readers` counts reading() blocks using it.
+    # `data_version` is the source's PRAGMA data_version when it was copied,
+    # and `checked_at` the last time it was known to match the source.
+    def __init__(self, number, uri, file, checked_at, keeper, data_version):
+        self.number = number
+        self.uri = uri
+        self.file = file
+        self.checked_at = checked_at
+        self.keeper = keeper
+        self.data_version = data_version
+        self.readers = 0
+
+
+class Replica:
+    """A read-only copy of a database, refreshed with the online backup API.
+
+    Every refresh copies the source into a new generation (a file next to
+    it, or a shared in-memory database) and then switches new readers over.
+    The copy runs outside the lock readers take, so it never blocks anyone
+    reading a generation that is still fresh. The copy is a single backup
+    step: a read transaction, which in WAL mode does not hold up writers.
+    Older generations are dropped once no reading() block uses them and
+    they are at least two refreshes old.
+
+    reading() routes the db2 calls in its block to the current generation.
+    Once that is older than `max_age` seconds it is checked against the
+    source first: it is kept if nothing was committed since it was copied,
+    and copied again otherwise.
+    """
+
+    def __init__(self, source, max_age=MAX_AGE, in_memory=IN_MEMORY):
+        self.source = source
+        self.max_age = max_age
+        self.in_memory = in_memory
+        self.name = next(_names)
+        # Part of every replica file name, so replicas of the same database
+        # in other processes never reuse, or delete, this one's files
+        self._token = f"{os.getpid()}-{secrets.token_hex(4)}"
+        # Guards the generations and their reader counts; never held for a copy
+        self._lock = threading.Lock()
+        # One copy or source check at a time; taken before self._lock, if both
+        self._copy_lock = threading.Lock()
+        self._generations = []
+        self._number = 0
+        # Connection to the source for backups and PRAGMA data_version, which
+        # only changes between calls on the same connection
+        self._source_conn = None
+        # Whether anyone read the replica since the last copy
+        self._read = False
+        self.refreshes = 0
+        self.refresh_seconds = 0.0
+
+    def refresh(self, force=True):
+        """Copy the source now; returns the seconds the copy took.
+
+        Without `force`, copies only if the replica was read since the last
+        copy and the source has changed since, and returns None otherwise.
+        """
+        with self._copy_lock:
+            if not force and not (self._read and self._changed()):
+                return None
+            return self._refresh()
+
+    def _data_version(self):
+        # Call with self._copy_lock held
+        if self._source_conn is None:
+            self._source_conn = sqlite3.connect(self.source, check_same_thread=False)
+        # fetchall(), so the statement finishes and gives up its read lock
+        return self._source_conn.execute("PRAGMA data_version").fetchall()[0][0]
+
+    def _changed(self):
+        # Call with self._copy_lock held. data_version changes whenever
+        # another connection, in any process, commits to the source.
+        return not self._generations or self._data_version() != self._generations[-1].data_version
+
+    def _refresh(self):
+        # Call with self._copy_lock held, and not self._lock
+        started = time.time()
+        self._number += 1
+        if self.in_memory:
+            uri = file = f"file:replica-{self.name}-{self._number}?mode=memory&cache=shared"
+        else:
+            stem, _ = os.path.splitext(os.path.abspath(self.source))
+            file = f"{stem}.replica-{self._token}-{self._number}.db"
+            # mode=ro, so a reader never creates an empty file in its place
+            uri = f"file:{file}?mode=ro"
+        # Read before copying: a commit in between only costs an extra refresh
+        data_version = self._data_version()
+        # For a file this connection only writes the copy; for memory it
+        # also keeps the database alive until the generation is dropped
+        keeper = sqlite3.connect(file, check_same_thread=False, uri=self.in_memory)
+        try:
+            self._source_conn.backup(keeper)
+            if not self.in_memory:
+                # Readers of a WAL file would need write access for the -shm file
+                keeper.execute("PRAGMA journal_mode = DELETE")
+                keeper.close()
+                keeper = None
+        except Exception:
+            if keeper is not None:
+                keeper.close()
+            raise
+        db_pool.get_pool(uri, factory=db_trace.TracedConnection, on_acquire=db_trace.record_wait, read_only=True)
+
+        with self._lock:
+            self._generations.append(_Generation(self._number, uri, file, started, keeper, data_version))
+            self._read = False
+            self._drop_unused()
+        elapsed = time.time() - started
+        self.refreshes += 1
+        self.refresh_seconds += elapsed
+        return elapsed
+
+    def _drop_unused(self, keep=2):
+        # Call with self._lock held. The newest `keep` generations stay, so
+        # a path() handed out just before a refresh remains readable for a
+        # whole refresh interval.
+        for generation in self._generations[:-keep] if keep else list(self._generations):
+            if not generation.readers:
+                self._generations.remove(generation)
+                db_pool.close_pool(generation.uri)
+                if generation.keeper is not None:
+                    generation.keeper.close()
+                elif os.path.exists(generation.file):
+                    os.remove(generation.file)
+
+    def _fresh(self):
+        # Call with self._lock held
+        generations = self._generations
+        if generations and time.time() - generations[-1].checked_at <= self.max_age:
+            return generations[-1]
+        return None
+
+    def _current(self, reader=False):
+        # The generation for new reads, brought up to date first if it is
+        # too old; with `reader`, counted as in use until _release()
+        while True:
+            with self._lock:
+                generation = self._fresh()
+                if generation is not None:
+                    self._read = True
+                    if reader:
+                        generation.readers += 1
+                    return generation
+            with self._copy_lock:
+                # Another reader may have brought it up to date meanwhile
+                with self._lock:
+                    if self._fresh() is not None:
+                        continue
+                if self._changed():
+                    self._refresh()
+                else:
+                    with self._lock:
+                        self._generations[-1].checked_at = time.time()
+
+    def _release(self, generation):
+        with self._lock:
+            generation.readers -= 1
+            self._drop_unused()
+
+    def age(self):
+        """Seconds since the current copy was last known to match the
+        source, or None before the first copy."""
+        generations = self._generations
+        return time.time() - generations[-1].checked_at if generations else None
+
+    def path(self):
+        """The current generation, brought up to date first if it is too old."""
+        return self._current().uri
+
+    @contextmanager
+    def reading(self):
+        generation = self._current(reader=True)
+        try:
+            with db2.using(generation.uri):
+                yield
+        finally:
+            self._release(generation)
+
+    def close(self):
+        with self._copy_lock:
+            with self._lock:
+                self._drop_unused(keep=0)
+            if self._source_conn is not None:
+                self._source_conn.close()
+                self._source_conn = None
+
+    def stats(self):
+        generations = list(self._generations)
+        return {
+            "source": self.source,
+            "path": generations[-1].uri if generations else None,
+            "in_memory": self.in_memory,
+            "max_age": self.max_age,
+            "age": self.age(),
+            "generations": len(generations),
+            "refreshes": self.refreshes,
+            "mean_refresh_seconds": self.refresh_seconds / self.refreshes if self.refreshes else 0.0,
+        }
+
+
+class ReplicaRefresher:
+    """Refreshes a replica in the background while it is being read and its
+    source changes, so readers rarely wait for a copy. An idle replica is
+    not copied; the next read checks it and copies it only if needed."""
+
+    def __init__(self, replica, interval=None):
+        self.replica = replica
+        # Half the staleness bound, so a copy is ready before readers need one
+        self.interval = replica.max_age / 2 if interval is None else interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="replica-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.replica.refresh(force=False)
+            except Exception:
+                # e.g. the source is locked for longer than the busy timeout;
+                # reading() copies on demand once the replica is too old
+                pass
+            self._stop.wait(self.interval)
+
+
+# Source path -> (Replica, ReplicaRefresher); one per database in use, so
+# every dealership (see tenants.py) gets its own
+_replicas = {}
+# (max_age, in_memory) once start() has been called
+_settings = None
+_replica_lock = threading.Lock()
+
+
+def start(max_age=MAX_AGE, in_memory=IN_MEMORY):
+    """Turn on analytics replicas for this process and start the one for
+    the current database; safe to call on every Streamlit rerun."""
+    global _settings
+    with _replica_lock:
+        if _settings is None:
+            _settings = (max_age, in_memory)
+    return get_replica()
+
+
+def stop(timeout=None):
+    global _settings
+    with _replica_lock:
+        entries = list(_replicas.values())
+        _replicas.clear()
+        _settings = None
+    for replica, refresher in entries:
+        refresher.stop(timeout)
+        replica.close()
+
+
+def get_replica(source=None):
+    """The replica of `source` (the current database by default), created on
+    first use; None until start() is called."""
+    source = source or db2.current_path()
+    entry = _replicas.get(source)
+    if entry is None:
+        # Replica generations are "file:" URIs; reads already on one stay there
+        if _settings is None or source.startswith("file:"):
+            return None
+        with _replica_lock:
+            entry = _replicas.get(source)
+            if entry is None and _settings is not None:
+                replica = Replica(source, *_settings)
+                refresher = ReplicaRefresher(replica)
+                refresher.start()
+                entry = _replicas[source] = (replica, refresher)
+    return entry[0] if entry else None
+
+
+def path():
+    """Current replica generation of the current database, or the database
+    itself if replicas are off. Pass it to db2.using() to keep several
+    short blocks of reads on the same copy; it stays readable for at least
+    one refresh interval."""
+    replica = get_replica()
+    return db2.current_path() if replica is None else replica.path()
+
+
+@contextmanager
+def reading():
+    """Route the db2 reads in this block to the current database's replica,
+    or leave them where they are if replicas are off."""
+    replica = get_replica()
+    if replica is None:
+        yield
+    else:
+        with replica.reading():
+            yield
@@ -0,0 +1,207 @@
+# db_trace.py
+import functools
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# Statements slower than this (execute plus fetching the result) are kept in
+# the slow query log along with their EXPLAIN QUERY PLAN output
+SLOW_QUERY_SECONDS = 0.1
+SLOW_QUERY_LOG_SIZE = 100
+
+call_seconds = metrics.registry.histogram("db_call_seconds", "Duration of db2 function calls")
+call_errors = metrics.registry.counter("db_call_errors_total", "db2 function calls that raised")
+call_rows = metrics.registry.counter("db_call_rows_total", "Rows fetched from SQLite by db2 function calls")
+call_wait = metrics.registry.histogram("db_call_connection_wait_seconds",
+                                       "Time db2 function calls spent waiting for a pooled connection")
+statement_seconds = metrics.registry.histogram("db_statement_seconds", "Duration of SQL statements")
+statement_rows = metrics.registry.counter("db_statement_rows_total", "Rows fetched (written, for executemany) per SQL statement")
+slow_statements = metrics.registry.counter("db_slow_statements_total", "SQL statements over the slow query threshold")
+
+_slow_log = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_local = threading.local()
+
+# Statements EXPLAIN QUERY PLAN can describe
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def statement_label(sql):
+    # One line, bounded length; the SQL in db2 is static so labels stay few
+    return re.sub(r"\s+", " ", sql).strip()[:200]
+
+
+def _frames():
+    frames = getattr(_local, "frames", None)
+    if frames is None:
+        frames = _local.frames = []
+    return frames
+
+
+def record_wait(seconds):
+    """Pool callback: charge connection wait time to the running db2 call."""
+    frames = _frames()
+    if frames:
+        frames[-1][1] += seconds
+
+
+def _record_rows(count):
+    frames = _frames()
+    if frames:
+        frames[-1][0] += count
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that times each statement and counts the rows fetched.
+
+    A statement's time covers execute() and every fetch up to the one that
+    drains the result (fetchall, fetchone, or a short fetchmany).
+    """
+
+    _sql = None
+    _open = False
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._elapsed += time.perf_counter() - start
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql, None)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed += time.perf_counter() - start
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, 0 if row is None else 1, done=True)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(start, len(rows), done=len(rows) < (self.arraysize if size is None else size))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), done=True)
+        return rows
+
+    def _start(self, sql, parameters):
+        # A result that was never drained ends when the cursor is reused
+        self._finish()
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = 0.0
+        self._rows = 0
+        self._open = True
+
+    def _fetched(self, start, count, done):
+        if self._sql is None:
+            return
+        _record_rows(count)
+        if not self._open:
+            statement_rows.inc(count, statement=statement_label(self._sql))
+            return
+        self._elapsed += time.perf_counter() - start
+        self._rows += count
+        if done:
+            self._finish()
+
+    def _finish(self):
+        if not self._open:
+            return
+        self._open = False
+        label = statement_label(self._sql)
+        statement_seconds.observe(self._elapsed, statement=label)
+        if self._rows:
+            statement_rows.inc(self._rows, statement=label)
+        if self._elapsed >= SLOW_QUERY_SECONDS:
+            slow_statements.inc(statement=label)
+            _slow_log.append({
+                "time": time.time(),
+                "seconds": self._elapsed,
+                "rows": self._rows,
+                "statement": label,
+                "plan": explain(self.connection, self._sql, self._parameters),
+            })
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors are TracedCursor."""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # The C implementations of these bypass cursor(), so route them through it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def explain(conn, sql, parameters=()):
+    """EXPLAIN QUERY PLAN lines for `sql`, or None if it cannot be explained."""
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE) or parameters is None:
+        return None
+    try:
+        # A plain cursor, so the EXPLAIN itself is not traced
+        rows = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error:
+        return None
+    return [row[-1] for row in rows]
+
+
+def slow_queries():
+    """Most recent slow statements, newest first."""
+    return list(reversed(_slow_log))
+
+
+def clear_slow_queries():
+    _slow_log.clear()
+
+
+def traced(func):
+    """Time calls to a data layer function, with the rows and connection wait they incur."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        frames = _frames()
+        frame = [0, 0.0]
+        frames.append(frame)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            call_errors.inc(function=name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            frames.pop()
+            if frames:
+                # Nested calls also count towards their caller
+                frames[-1][0] += frame[0]
+                frames[-1][1] += frame[1]
+            call_seconds.observe(elapsed, function=name)
+            call_wait.observe(frame[1], function=name)
+            if frame[0]:
+                call_rows.inc(frame[0], function=name)
+
+    return wrapper
@@ -0,0 +1,29 @@
+# inventory.py
+
+
+class InventoryIndex:
+    """Lookup tables over one list of Car records, built once per query result.
+
+    Car pickers show `labels` and resolve the chosen label with `id_by_label`;
+    the selected car is then found with `by_id` instead of scanning the list.
+    """
+
+    def __init__(self, cars):
+        self.cars = cars
+        self.by_id = {}
+        self.by_plate = {}
+        self.id_by_label = {}
+        for car in cars:
+            self.by_id[car.id] = car
+            self.by_plate[car.license_plate] = car
+            self.id_by_label[car.label] = car.id
+        self.labels = list(self.id_by_label)
+
+    def __len__(self):
+        return len(self.cars)
+
+    def get(self, car_id):
+        return self.by_id.get(car_id)
+
+    def get_by_plate(self, license_plate):
+        return self.by_plate.get(license_plate)
@@ -0,0 +1,387 @@
+# jobs.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+import bulk
+import db2
+import db_replica
+import tenants
+from models import Job
+
+# Job states. Queued jobs wait for a worker; a failed attempt goes back to
+# queued until max_attempts is reached.
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+JOB_WORKERS = 2
+# Workers also wake up when a job is submitted in this process; polling
+# catches jobs queued by other processes and retries coming due
+POLL_INTERVAL = 2.0
+MAX_ATTEMPTS = 3
+# Seconds before the first retry, doubling after every failed attempt
+RETRY_DELAY = 5.0
+# Recording a job's outcome is retried this many times, this many seconds
+# apart, when the database stays locked past its busy timeout
+STATE_UPDATE_ATTEMPTS = 3
+STATE_UPDATE_DELAY = 1.0
+
+# Uploaded import files and finished exports live here, next to the database
+JOB_FILES_DIR = "job_files"
+
+# kind -> (handler, default max_attempts)
+HANDLERS = {}
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised in a handler by JobContext.progress() once its job is cancelled."""
+
+
+class JobContext:
+    """What a handler gets: the job's id and params, and a way to report progress."""
+
+    def __init__(self, job_id, kind, params, attempt, tenant=None):
+        self.id = job_id
+        self.kind = kind
+        self.params = params
+        self.attempt = attempt
+        self.tenant = tenant
+
+    def progress(self, fraction=None, message=None):
+        """Record progress (fraction from 0 to 1, or None if unknown) and a
+        status message. Raises JobCancelled if the job was cancelled, so
+        handlers should call this between units of work."""
+        with db2._connect_main() as conn:
+            conn.execute("UPDATE jobs SET progress = IFNULL(?, progress), message = IFNULL(?, message) WHERE id = ?",
+                         (fraction, message, self.id))
+            conn.commit()
+            cancel_requested = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (self.id,)).fetchone()[0]
+        if cancel_requested:
+            raise JobCancelled()
+
+
+def handler(kind, max_attempts=MAX_ATTEMPTS):
+    """Register a function taking a JobContext as the handler for `kind`.
+
+    Whatever it returns must be JSON serialisable and is stored as the result.
+    """
+    def register(func):
+        HANDLERS[kind] = (func, max_attempts)
+        return func
+    return register
+
+
+def files_dir():
+    path = os.path.join(os.path.dirname(os.path.abspath(db2.DB_PATH)), JOB_FILES_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def submit(kind, params=None, created_by=None, max_attempts=None):
+    """Queue a job; returns its id. It runs against the dealership current
+    when it was submitted (see tenants.using())."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind {kind!r}")
+    if max_attempts is None:
+        max_attempts = HANDLERS[kind][1]
+    with db2._connect_main() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO jobs (kind, params, status, max_attempts, created_by, created_at, tenant)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (kind, json.dumps(params or {}), JOB_QUEUED, max_attempts, created_by, time.time(),
+              tenants.current()))
+        conn.commit()
+        job_id = cursor.lastrowid
+    if _runner is not None:
+        _runner.wake()
+    return job_id
+
+
+def get_job(job_id):
+    with db2._connect_main() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = Job.row_factory
+        cursor.execute(f"SELECT {', '.join(Job.fields)} FROM jobs WHERE id = ?", (job_id,))
+        return cursor.fetchone()
+
+
+# list_jobs(), cancel() and retry() take the dealership explicitly rather
+# than reading tenants.current(): Streamlit fragment reruns happen outside
+# the page's tenants.using() block
+
+def list_jobs(tenant, limit=50):
+    """A dealership's jobs (None for group-wide ones), most recent first."""
+    with db2._connect_main() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = Job.row_factory
+        cursor.execute(f"SELECT {', '.join(Job.fields)} FROM jobs WHERE tenant IS ? ORDER BY id DESC LIMIT ?",
+                       (tenant, limit))
+        return cursor.fetchall()
+
+
+def cancel(job_id, tenant):
+    """Cancel a queued job of `tenant`, or ask a running one to stop at its
+    next progress report. Returns False if the job had already finished or
+    belongs to another dealership."""
+    with db2._connect_main() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND tenant IS ? AND status = ?",
+                       (JOB_CANCELLED, time.time(), job_id, tenant, JOB_QUEUED))
+        if cursor.rowcount == 0:
+            cursor.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND tenant IS ? AND status = ?",
+                           (job_id, tenant, JOB_RUNNING))
+        conn.commit()
+        return cursor.rowcount == 1
+
+
+def retry(job_id, tenant):
+    """Queue a failed or cancelled job of `tenant` again with a fresh set of attempts."""
+    with db2._connect_main() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+        UPDATE jobs SET status = ?, attempts = 0, cancel_requested = 0, progress = NULL, message = NULL,
+                        error = NULL, result = NULL, started_at = NULL, finished_at = NULL, run_after = NULL
+        WHERE id = ? AND tenant IS ? AND status IN (?, ?)
+        ''', (JOB_QUEUED, job_id, tenant, JOB_FAILED, JOB_CANCELLED))
+        conn.commit()
+        retried = cursor.rowcount == 1
+    if retried and _runner is not None:
+        _runner.wake()
+    return retried
+
+
+def requeue_interrupted():
+    """Put jobs left running by a previous process back in the queue; returns
+    how many were requeued.
+
+    Jobs without attempts left fail instead, so a handler that must not run
+    twice (max_attempts=1) is never replayed. Only call this when no other
+    process is running jobs on the same database.
+    """
+    with db2._connect_main() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute('''
+        UPDATE jobs SET status = ?, run_after = NULL, message = ?
+        WHERE status = ? AND attempts < max_attempts
+        ''', (JOB_QUEUED, "Requeued after a restart", JOB_RUNNING))
+        requeued = cursor.rowcount
+        cursor.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ?",
+                       (JOB_FAILED, "Interrupted by a restart", time.time(), JOB_RUNNING))
+        conn.commit()
+        return requeued
+
+
+def _claim():
+    # Take the oldest due job; BEGIN IMMEDIATE so two workers never get the same one
+    now = time.time()
+    with db2._connect_main() as conn:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.execute('''
+            SELECT id, kind, params, attempts, max_attempts, tenant FROM jobs
+            WHERE status = ? AND IFNULL(run_after, 0) <= ?
+            ORDER BY id LIMIT 1
+            ''', (JOB_QUEUED, now))
+            row = cursor.fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            cursor.execute('''
+            UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, progress = NULL,
+                            cancel_requested = 0
+            WHERE id = ?
+            ''', (JOB_RUNNING, now, row[0]))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    job_id, kind, params, attempts, max_attempts, tenant = row
+    return job_id, kind, json.loads(params) if params else {}, attempts + 1, max_attempts, tenant
+
+
+def _finish(job_id, status, result=None, error=None, message=None):
+    with db2._connect_main() as conn:
+        conn.execute('''
+        UPDATE jobs SET status = ?, result = ?, error = ?, message = IFNULL(?, message), finished_at = ?,
+                        progress = CASE WHEN ? THEN 1.0 ELSE progress END
+        WHERE id = ?
+        ''', (status, None if result is None else json.dumps(result), error, message, time.time(),
+              status == JOB_DONE, job_id))
+        conn.commit()
+
+
+def _retry_later(job_id, attempt, error):
+    delay = RETRY_DELAY * 2 ** (attempt - 1)
+    with db2._connect_main() as conn:
+        conn.execute("UPDATE jobs SET status = ?, error = ?, message = ?, run_after = ? WHERE id = ?",
+                     (JOB_QUEUED, error, f"Attempt {attempt} failed; retrying in {delay:.0f}s",
+                      time.time() + delay, job_id))
+        conn.commit()
+
+
+def _record(update, *args, **kwargs):
+    # Run a job state update, retrying while the database is locked, so a
+    # finished job is not left looking like it is still running
+    for attempt in range(1, STATE_UPDATE_ATTEMPTS + 1):
+        try:
+            return update(*args, **kwargs)
+        except sqlite3.OperationalError:
+            if attempt == STATE_UPDATE_ATTEMPTS:
+                raise
+            time.sleep(STATE_UPDATE_DELAY)
+
+
+def run_job(job_id, kind, params, attempt, max_attempts, tenant=None):
+    context = JobContext(job_id, kind, params, attempt, tenant)
+    try:
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown job kind {kind!r}")
+        with tenants.using(tenant):
+            result = HANDLERS[kind][0](context)
+    except JobCancelled:
+        _record(_finish, job_id, JOB_CANCELLED, message="Cancelled")
+    except Exception as e:
+        error = "".join(traceback.format_exception_only(type(e), e)).strip()
+        if attempt < max_attempts:
+            _record(_retry_later, job_id, attempt, error)
+        else:
+            _record(_finish, job_id, JOB_FAILED, error=error)
+    else:
+        _record(_finish, job_id, JOB_DONE, result=result)
+
+
+class JobRunner:
+    """A pool of worker threads taking jobs from the jobs table."""
+
+    def __init__(self, workers=JOB_WORKERS, poll_interval=POLL_INTERVAL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._wake = threading.Condition()
+        self._threads = []
+
+    def start(self):
+        requeue_interrupted()
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self):
+        with self._wake:
+            self._wake.notify_all()
+
+    def stop(self, timeout=None):
+        """Stop taking jobs and wait for the running ones to finish."""
+        self._stop.set()
+        self.wake()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self):
+        while not self._stop.is_set():
+            try:
+                job = _claim()
+            except Exception:
+                # e.g. the database is locked for longer than the busy timeout
+                job = None
+            if job is None:
+                with self._wake:
+                    self._wake.wait(self.poll_interval)
+                continue
+            try:
+                run_job(*job)
+            except Exception:
+                # Its outcome could not be recorded; the job stays running
+                # until the next restart requeues it, but this worker goes on
+                logger.exception("Could not record the outcome of job %s", job[0])
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def start(workers=JOB_WORKERS):
+    """Start the process-wide runner; safe to call on every Streamlit rerun."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner(workers)
+            _runner.start()
+        return _runner
+
+
+def stop(timeout=None):
+    global _runner
+    with _runner_lock:
+        runner, _runner = _runner, None
+    if runner is not None:
+        runner.stop(timeout)
+
+
+# Handlers
+
+@handler("import_cars")
+def _import_cars(job):
+    report = bulk.import_cars(job.params["path"], fmt=job.params.get("format"),
+                              progress=lambda r: job.progress(message=f"{r['rows']} rows processed"))
+    os.remove(job.params["path"])
+    return report
+
+
+# Not retried: parts from chunks committed before a failure would be added twice
+@handler("import_spare_parts", max_attempts=1)
+def _import_spare_parts(job):
+    report = bulk.import_spare_parts(job.params["path"], fmt=job.params.get("format"),
+                                     progress=lambda r: job.progress(message=f"{r['rows']} rows processed"))
+    os.remove(job.params["path"])
+    return report
+
+
+# Table behind each export, to size the progress bar
+EXPORT_TABLES = {"sales": "sales", "inventory": "cars"}
+
+
+@handler("export")
+def _export(job):
+    name, fmt = job.params["name"], job.params.get("format", "csv")
+    path = os.path.join(files_dir(), f"export-{job.id}.{fmt}")
+    # Exports are reports: read from the analytics replica when there is one
+    with db_replica.reading():
+        with db2._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM {EXPORT_TABLES[name]}").fetchone()[0]
+        try:
+            count = bulk.export(name, path, fmt=fmt,
+                                progress=lambda n: job.progress(n / total if total else None, f"{n} of {total} rows"))
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+    return {"path": path, "rows": count, "file_name": f"{name}.{fmt}"}
+
+
+@handler("rebuild_rollups")
+def _rebuild_rollups(job):
+    db2.rebuild_sales_rollups()
+    sales_count, revenue, profit = db2.get_sales_summary()
+    return {"sales": sales_count, "revenue": revenue, "profit": profit}
+
+
+@handler("vacuum", max_attempts=1)
+def _vacuum(job):
+    pruned = db2.prune_change_log()
+    before, after = db2.vacuum_db()
+    return {"bytes_before": before, "bytes_after": after, "change_log_pruned": pruned}
@@ -0,0 +1,119 @@
+"""Command-line maintenance tasks for the car inventory database.
+
+    python manage.py import-cars dealer_feed.csv
+    python manage.py import-parts parts.parquet
+    python manage.py export sales sales.csv
+    python manage.py export inventory inventory.parquet
+    python manage.py rebuild-rollups
+    python manage.py add-tenant north "North Motors"
+    python manage.py assign-user alice north
+    python manage.py --tenant north import-cars north_feed.csv
+"""
+import argparse
+import sys
+
+import bulk
+import db2
+import tenants
+
+
+def _print_report(report):
+    print(f"rows read: {report['rows']}, inserted: {report['inserted']}, "
+          f"duplicates: {report['duplicates']}, unmatched: {report['unmatched']}, "
+          f"invalid: {report['invalid']}")
+    for error in report["errors"]:
+        print(f"  {error}", file=sys.stderr)
+
+
+def cmd_import_cars(args):
+    _print_report(bulk.import_cars(args.file, fmt=args.format, chunk_size=args.chunk_size))
+
+
+def cmd_import_parts(args):
+    _print_report(bulk.import_spare_parts(args.file, fmt=args.format, chunk_size=args.chunk_size))
+
+
+def cmd_export(args):
+    count = bulk.export(args.table, args.file, fmt=args.format, chunk_size=args.chunk_size)
+    print(f"exported {count} rows to {args.file}")
+
+
+def cmd_rebuild_rollups(args):
+    db2.rebuild_sales_rollups()
+    sales_count, revenue, profit = db2.get_sales_summary()
+    print(f"rebuilt sales rollups from {sales_count} sales (revenue {revenue:,.2f}, profit {profit:,.2f})")
+
+
+def cmd_add_tenant(args):
+    try:
+        tenant = tenants.add_tenant(args.id, args.name)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"added dealership {tenant.id} ({tenant.name}) at {tenants.path(tenant.id)}")
+
+
+def cmd_assign_user(args):
+    try:
+        assigned = tenants.assign_user(args.username, args.tenant)
+    except KeyError as e:
+        sys.exit(e.args[0])
+    if not assigned:
+        sys.exit(f"no such user: {args.username}")
+    print(f"{args.username} now works for {args.tenant or 'the whole group'}")
+
+
+def cmd_list_tenants(args):
+    for tenant in tenants.list_tenants():
+        print(f"{tenant.id}\t{tenant.name}\t{tenants.path(tenant.id)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=db2.DB_PATH, help="database file (default: %(default)s)")
+    parser.add_argument("--tenant", help="dealership to work on (default: the main database)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    for name, func, help_text in (("import-cars", cmd_import_cars, "bulk load cars"),
+                                  ("import-parts", cmd_import_parts, "bulk load spare parts by license plate")):
+        sub = commands.add_parser(name, help=help_text)
+        sub.add_argument("file")
+        sub.set_defaults(func=func)
+
+    sub = commands.add_parser("export", help="stream a table to CSV or Parquet")
+    sub.add_argument("table", choices=sorted(bulk.EXPORTS))
+    sub.add_argument("file")
+    sub.set_defaults(func=cmd_export)
+
+    for sub in commands.choices.values():
+        sub.add_argument("--format", choices=["csv", "parquet"], help="default: from the file extension")
+        sub.add_argument("--chunk-size", type=int, default=bulk.CHUNK_SIZE)
+
+    sub = commands.add_parser("rebuild-rollups", help="recompute the sales dashboard rollups")
+    sub.set_defaults(func=cmd_rebuild_rollups)
+
+    sub = commands.add_parser("add-tenant", help="register a dealership with its own database file")
+    sub.add_argument("id")
+    sub.add_argument("name")
+    sub.set_defaults(func=cmd_add_tenant)
+
+    sub = commands.add_parser("assign-user", help="give a user access to a dealership, or to the whole group if omitted")
+    sub.add_argument("username")
+    sub.add_argument("tenant", nargs="?")
+    sub.set_defaults(func=cmd_assign_user)
+
+    sub = commands.add_parser("list-tenants", help="list dealerships and their database files")
+    sub.set_defaults(func=cmd_list_tenants)
+
+    args = parser.parse_args(argv)
+    db2.DB_PATH = args.db
+    db2.init_db()
+    try:
+        tenants.path(args.tenant)
+    except KeyError as e:
+        sys.exit(e.args[0])
+    with tenants.using(args.tenant):
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
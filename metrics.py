@@ -0,0 +1,200 @@
+# metrics.py
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Where the Metrics page writes and serves the registry; fixed here rather
+# than chosen on the page, so no signed-in user can overwrite other files
+PROMETHEUS_FILE = "metrics.prom"
+PROMETHEUS_PORT = 9108
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+    def prometheus(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.samples().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [bucket counts..., +Inf count, sum, max]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0, 0.0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] = max(series[-1], value)
+
+    def summary(self):
+        """labels -> dict(count, sum, mean, max, p50, p95, p99) estimated from the buckets."""
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        result = {}
+        for key, series in values.items():
+            counts = series[:len(self.buckets) + 1]
+            count = sum(counts)
+            result[key] = {
+                "count": count,
+                "sum": series[-2],
+                "mean": series[-2] / count if count else 0.0,
+                "max": series[-1],
+                "p50": self._quantile(counts, count, 0.50, series[-1]),
+                "p95": self._quantile(counts, count, 0.95, series[-1]),
+                "p99": self._quantile(counts, count, 0.99, series[-1]),
+            }
+        return result
+
+    def _quantile(self, counts, count, q, maximum):
+        # Upper bound of the bucket holding the q-th observation
+        rank = q * count
+        running = 0
+        for bound, n in zip(self.buckets + (maximum,), counts):
+            running += n
+            if running >= rank and n:
+                return min(bound, maximum)
+        return maximum
+
+    def prometheus(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = {key: list(series) for key, series in self._values.items()}
+        for key, series in sorted(values.items()):
+            running = 0
+            for bound, n in zip(self.buckets, series):
+                running += n
+                lines.append(f"{self.name}_bucket{_format_labels(key, [('le', bound)])} {running}")
+            running += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(key, [('le', '+Inf')])} {running}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {running}")
+        return lines
+
+
+class MetricsRegistry:
+    """In-process counters and histograms, exportable in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {type(metric).__name__}")
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def metrics(self):
+        with self._lock:
+            return dict(self._metrics)
+
+    @contextmanager
+    def timer(self, name, help_text="", **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, help_text).observe(time.perf_counter() - start, **labels)
+
+    def to_prometheus(self):
+        lines = []
+        for _, metric in sorted(self.metrics().items()):
+            lines.extend(metric.prometheus())
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Write then rename so a scraper never reads a half-written file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+timer = registry.timer
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve_prometheus(port, host="127.0.0.1"):
+    """Serve the registry at http://host:port/metrics from a daemon thread.
+
+    Safe to call on every Streamlit rerun; only the first call starts a server.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        _server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+        return _server
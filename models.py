@@ -0,0 +1,119 @@
+# models.py
+import json
+
+# Compact record types for rows of the cars, spare_parts, sales and jobs tables.
+# They use __slots__ instead of a per-instance __dict__, and still support
+# indexing and unpacking in column order, like the tuples they replace.
+
+
+class Record:
+    __slots__ = ()
+    fields = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.fields, values):
+            setattr(self, name, value)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.fields)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+        return getattr(self, self.fields[index])
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            return type(self) is type(other) and tuple(self) == tuple(other)
+        if isinstance(other, tuple):
+            return tuple(self) == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        values = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.fields)
+        return f"{type(self).__name__}({values})"
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        # For cursor.row_factory; the query must select cls.fields in order
+        return cls(*row)
+
+
+class Car(Record):
+    fields = ("id", "manufacture", "model", "specification", "kilometers", "gear_type", "fuel",
+              "license_plate", "price", "color", "extra_items")
+    __slots__ = fields
+
+    @property
+    def label(self):
+        return f"{self.manufacture} {self.model} ({self.license_plate})"
+
+
+class InventoryCar(Car):
+    # A car joined with the total cost of its spare parts
+    fields = Car.fields + ("spare_parts_cost",)
+    __slots__ = ("spare_parts_cost",)
+
+    @property
+    def total_cost(self):
+        return (self.price or 0.0) + (self.spare_parts_cost or 0.0)
+
+
+class SparePart(Record):
+    fields = ("id", "car_id", "part_name", "cost")
+    __slots__ = fields
+
+
+class Sale(Record):
+    fields = ("id", "car_id", "manufacture", "model", "specification", "license_plate",
+              "sale_price", "sale_cost", "sale_date")
+    __slots__ = fields
+
+    @property
+    def profit(self):
+        return (self.sale_price or 0.0) - (self.sale_cost or 0.0)
+
+
+class Job(Record):
+    # params and result are stored as JSON and decoded by row_factory
+    fields = ("id", "kind", "params", "status", "progress", "message", "result", "error", "attempts",
+              "max_attempts", "cancel_requested", "created_by", "created_at", "started_at", "finished_at", "tenant")
+    __slots__ = fields
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        job = cls(*row)
+        job.params = json.loads(job.params) if job.params else {}
+        job.result = json.loads(job.result) if job.result else None
+        return job
+
+
+def fetch_columns(cursor, chunk_size=10000):
+    """Drain an executed cursor into a dict of column name -> list of values.
+
+    Rows are consumed chunk by chunk and never kept, so the result holds one
+    list per column rather than one object per row. It can be passed straight
+    to pandas.DataFrame or st.dataframe.
+    """
+    names = [description[0] for description in cursor.description]
+    columns = [[] for _ in names]
+    # sqlite3 creates a new str for every text value; share equal ones so
+    # repetitive columns (manufacture, fuel, ...) cost one pointer per row
+    strings = {}
+    share = strings.setdefault
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for column, values in zip(columns, zip(*rows)):
+            if isinstance(values[0], str):
+                column.extend([share(value, value) if isinstance(value, str) else value for value in values])
+            else:
+                column.extend(values)
+    return dict(zip(names, columns))
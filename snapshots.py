@@ -0,0 +1,117 @@
+# snapshots.py
+import threading
+from collections import Counter
+
+import db2
+
+
+class InventorySnapshot:
+    """One session's copy of the inventory, kept current from the change feed.
+
+    Holds every car (as db2 InventoryCar records) with running totals and
+    filter options. refresh() asks db2.changes_since() what changed since
+    the last refresh and re-reads only those cars; it falls back to a full
+    reload when the feed cannot cover the gap, so a refresh with no writes
+    costs one small query. It holds every car, so keep one per process
+    rather than one per Streamlit session: View Inventory reads the shared
+    ones through filter_options() and inventory_totals() below.
+    """
+
+    def __init__(self):
+        # Database the snapshot was loaded from; another one (a different
+        # dealership after logging in again) means a full reload
+        self.source = None
+        self.version = None
+        self.cars = {}
+        self.total_cost = 0.0
+        self._manufactures = Counter()
+        self._models = Counter()
+        self.full_loads = 0
+        self.cars_reloaded = 0
+
+    def __len__(self):
+        return len(self.cars)
+
+    def refresh(self):
+        """Bring the snapshot up to date; returns the number of cars re-read."""
+        if self.version is not None and self.source == db2.current_path():
+            change_set = db2.changes_since(self.version, tables=("cars", "spare_parts"))
+            if change_set.complete:
+                car_ids = {change.car_id for change in change_set.changes if change.car_id is not None}
+                if car_ids:
+                    self._apply(car_ids, db2.get_cars_with_parts_cost(car_ids))
+                self.version = change_set.version
+                self.cars_reloaded += len(car_ids)
+                return len(car_ids)
+        return self._reload()
+
+    def _reload(self):
+        # The version is read first, so anything written while the cars are
+        # being read is applied again on the next refresh. The read cache is
+        # bypassed: an entry older than the version would miss changes made
+        # by other processes, and the feed would never bring them back.
+        version = db2.get_change_version()
+        self.source = db2.current_path()
+        self.cars = {}
+        self.total_cost = 0.0
+        self._manufactures.clear()
+        self._models.clear()
+        for car in db2.get_car_with_spare_parts.uncached():
+            self._add(car)
+        self.version = version
+        self.full_loads += 1
+        self.cars_reloaded += len(self.cars)
+        return len(self.cars)
+
+    def _apply(self, car_ids, cars):
+        for car_id in car_ids:
+            old = self.cars.pop(car_id, None)
+            if old is not None:
+                self._remove(old)
+        for car in cars:
+            self._add(car)
+
+    def _add(self, car):
+        self.cars[car.id] = car
+        self.total_cost += car.total_cost
+        self._manufactures[car.manufacture] += 1
+        self._models[car.model] += 1
+
+    def _remove(self, car):
+        self.total_cost -= car.total_cost
+        for counter, value in ((self._manufactures, car.manufacture), (self._models, car.model)):
+            counter[value] -= 1
+            if not counter[value]:
+                del counter[value]
+
+    def filter_options(self):
+        """Distinct manufactures and models, like db2.get_car_filter_options()."""
+        return (sorted(self._manufactures, key=lambda value: (value is not None, value or "")),
+                sorted(self._models, key=lambda value: (value is not None, value or "")))
+
+
+# One snapshot per database file, shared by every session in the process
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+def _read(read):
+    # Refresh the current database's shared snapshot and read from it under
+    # the lock, so no session sees it halfway through a refresh
+    path = db2.current_path()
+    with _shared_lock:
+        snapshot = _shared.get(path)
+        if snapshot is None:
+            snapshot = _shared[path] = InventorySnapshot()
+        snapshot.refresh()
+        return read(snapshot)
+
+
+def filter_options():
+    """Distinct manufactures and models of the current database."""
+    return _read(InventorySnapshot.filter_options)
+
+
+def inventory_totals():
+    """Number of cars and their total cost, like db2.get_inventory_totals()."""
+    return _read(lambda snapshot: (len(snapshot), snapshot.total_cost))
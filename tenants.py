@@ -0,0 +1,149 @@
+# tenants.py
+import contextvars
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+
+import db2
+import db_async
+import db_replica
+
+# Each dealership's cars, spare parts, sales and rollups live in their own
+# database file in this directory, next to the main database, so one
+# branch's writes never wait on another's lock. The main database keeps
+# users, jobs and the list of dealerships, and is itself the data file for
+# tenant None (group-wide users and single-dealership installs).
+TENANT_DIR = "tenants"
+
+# Dealership ids end up in file names
+TENANT_ID = re.compile(r"^[a-z0-9][a-z0-9_-]{0,39}$")
+
+Tenant = namedtuple("Tenant", ["id", "name", "file"])
+
+# Dealership of the current context; see using()
+_tenant = contextvars.ContextVar("tenant", default=None)
+
+# (main database, tenant id) -> database path, filled from the tenants table
+_paths = {}
+_paths_lock = threading.Lock()
+
+
+def current():
+    return _tenant.get()
+
+
+def _path_for(file):
+    return os.path.join(os.path.dirname(os.path.abspath(db2.DB_PATH)), TENANT_DIR, file)
+
+
+def list_tenants():
+    with db2._connect_main() as conn:
+        return [Tenant(*row) for row in conn.execute("SELECT id, name, file FROM tenants ORDER BY id")]
+
+
+def add_tenant(tenant_id, name):
+    """Register a dealership and create its database; returns the Tenant.
+
+    Raises ValueError for an id that is malformed or already taken.
+    """
+    if not TENANT_ID.match(tenant_id):
+        raise ValueError(f"Invalid dealership id {tenant_id!r}: use lowercase letters, digits, '-' and '_'")
+    tenant = Tenant(tenant_id, name, f"{tenant_id}.db")
+    os.makedirs(os.path.dirname(_path_for(tenant.file)), exist_ok=True)
+    with db2._connect_main() as conn:
+        try:
+            conn.execute("INSERT INTO tenants (id, name, file) VALUES (?, ?, ?)", tenant)
+            conn.commit()
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Dealership {tenant_id!r} already exists") from None
+    with using(tenant_id):
+        # using() creates the schema
+        pass
+    return tenant
+
+
+def path(tenant_id):
+    """Database file of a dealership; DB_PATH for None. Raises KeyError for
+    an unknown id."""
+    if tenant_id is None:
+        return db2.DB_PATH
+    key = (db2.DB_PATH, tenant_id)
+    found = _paths.get(key)
+    if found is None:
+        # Not seen yet, or added by another process since the last lookup
+        with _paths_lock:
+            for tenant in list_tenants():
+                _paths[(db2.DB_PATH, tenant.id)] = _path_for(tenant.file)
+            found = _paths.get(key)
+        if found is None:
+            raise KeyError(f"Unknown dealership {tenant_id!r}")
+    return found
+
+
+@contextmanager
+def using(tenant_id):
+    """Run the db2 calls in this block against a dealership's database.
+
+    The schema is brought up to date the first time a process uses it.
+    db_async calls started in the block, and jobs submitted from it, follow.
+    """
+    token = _tenant.set(tenant_id)
+    try:
+        with db2.using(path(tenant_id)):
+            db2.init_db()
+            yield
+    finally:
+        _tenant.reset(token)
+
+
+def assign_user(username, tenant_id):
+    """Move a user to a dealership (None for group-wide), approving them if
+    they registered in the app; False if no such user."""
+    if tenant_id is not None:
+        path(tenant_id)
+    return db2.set_user_tenant(username, tenant_id)
+
+
+def _call(tenant_id, replica, func, args, kwargs):
+    # Runs on a db_async worker, in a copy of the caller's context, so the
+    # dealerships do not see each other's using(). The schema check and a
+    # replica copy can be slow too, so they happen here in parallel rather
+    # than one after another on the event loop.
+    with using(tenant_id), db_replica.reading() if replica else nullcontext():
+        return func(*args, **kwargs)
+
+
+def fan_out(func, *args, tenants=None, replica=False, **kwargs):
+    """Call a db2 function against several dealerships concurrently on the
+    db_async read workers; returns {tenant id: result}.
+
+    `tenants` defaults to the main database (None) plus every registered
+    dealership. With `replica`, reads go to each database's analytics
+    replica when db_replica is started.
+    """
+    if tenants is None:
+        tenants = [None] + [tenant.id for tenant in list_tenants()]
+    tenants = list(tenants)
+    results = db_async.run(*(db_async.call(_call, tenant_id, replica, func, args, kwargs) for tenant_id in tenants))
+    return dict(zip(tenants, results))
+
+
+# Group-wide reports: ({tenant id: row}, total row) across dealerships
+
+def _total(rows, empty):
+    return tuple(sum(values) for values in zip(*rows.values())) if rows else empty
+
+
+def group_sales_summary(start=None, end=None, tenants=None):
+    """Sales count, revenue and profit per dealership over an optional date window."""
+    rows = fan_out(db2.get_sales_summary, start, end, tenants=tenants, replica=True)
+    return rows, _total(rows, (0, 0.0, 0.0))
+
+
+def group_inventory_totals(tenants=None):
+    """Cars in stock and their total cost including spare parts, per dealership."""
+    rows = fan_out(db2.get_inventory_totals, tenants=tenants, replica=True)
+    return rows, _total(rows, (0, 0.0))
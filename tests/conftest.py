@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db2
+import db_pool
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """A fresh, migrated database in a temporary directory."""
+    monkeypatch.setattr(db2, "DB_PATH", str(tmp_path / "car_inventory.db"))
+    db2.init_db()
+    yield db2
+    db_pool.close_all()
@@ -0,0 +1,41 @@
+import bulk
+
+
+def _write(tmp_path, name, lines):
+    path = tmp_path / name
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+
+
+CAR_HEADER = ",".join(bulk.CAR_COLUMNS)
+
+
+def test_import_cars_counts_inserted_and_duplicate_plates(db, tmp_path):
+    db.add_car("Toyota", "Corolla", "", 1000, "Manual", "Petrol", "AA-1", 5000.0, "", "")
+    path = _write(tmp_path, "cars.csv", [
+        CAR_HEADER,
+        "Honda,Civic,,100,Manual,Petrol,BB-1,6000,Red,",
+        "Honda,Jazz,,200,Automatic,Petrol,BB-2,4000,Blue,",
+        "Kia,Rio,,300,Manual,Diesel,BB-3,3000,White,",
+        "Toyota,Yaris,,400,Manual,Petrol,AA-1,3500,Grey,",
+    ])
+
+    report = bulk.import_cars(path)
+
+    assert (report["rows"], report["inserted"], report["duplicates"], report["invalid"]) == (4, 3, 1, 0)
+    assert len(db.get_all_cars()) == 4
+
+
+def test_import_spare_parts_counts_unmatched_plates(db, tmp_path):
+    db.add_car("Toyota", "Corolla", "", 1000, "Manual", "Petrol", "AA-1", 5000.0, "", "")
+    path = _write(tmp_path, "parts.csv", [
+        ",".join(bulk.SPARE_PART_COLUMNS),
+        "AA-1,Brake pads,120",
+        "ZZ,Mirror,80",
+    ])
+
+    report = bulk.import_spare_parts(path)
+
+    # The change_log rows written for each part are not counted as inserts
+    assert (report["rows"], report["inserted"], report["unmatched"]) == (2, 1, 1)
+    assert db.get_spare_parts_cost(1) == 120.0
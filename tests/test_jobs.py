@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+import jobs
+
+
+def _mark_running(db, job_id, attempts):
+    with db._connect_main() as conn:
+        conn.execute("UPDATE jobs SET status = ?, attempts = ? WHERE id = ?", (jobs.JOB_RUNNING, attempts, job_id))
+        conn.commit()
+
+
+def test_requeue_interrupted_fails_jobs_without_attempts_left(db):
+    retried = jobs.submit("import_cars", {"path": "cars.csv"})
+    once = jobs.submit("import_spare_parts", {"path": "parts.csv"})
+    _mark_running(db, retried, 1)
+    _mark_running(db, once, 1)
+
+    assert jobs.requeue_interrupted() == 1
+
+    assert jobs.get_job(retried).status == jobs.JOB_QUEUED
+    job = jobs.get_job(once)
+    assert (job.status, job.error) == (jobs.JOB_FAILED, "Interrupted by a restart")
+
+
+def test_worker_survives_a_failed_state_update(db, monkeypatch):
+    calls = []
+
+    def locked(*args, **kwargs):
+        calls.append(args)
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(jobs, "_finish", locked)
+    monkeypatch.setattr(jobs, "STATE_UPDATE_DELAY", 0)
+    runner = jobs.JobRunner(workers=1, poll_interval=0.05)
+    runner.start()
+    try:
+        jobs.submit("rebuild_rollups")
+        deadline = time.time() + 5
+        while len(calls) < jobs.STATE_UPDATE_ATTEMPTS and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        assert len(calls) == jobs.STATE_UPDATE_ATTEMPTS
+        assert all(thread.is_alive() for thread in runner._threads)
+    finally:
+        runner.stop(timeout=5)
@@ -0,0 +1,24 @@
+import db2
+
+
+def _add_cars(prices):
+    for number, price in enumerate(prices, 1):
+        db2.add_car("Toyota", "Corolla", "", 1000 * number, "Manual", "Petrol",
+                    f"PL-{number}", price, "White", "")
+
+
+def _all_pages(**kwargs):
+    ids, after = [], None
+    while True:
+        cars, after = db2.query_cars.uncached(after=after, limit=2, **kwargs)
+        ids.extend(car.id for car in cars)
+        if after is None:
+            return ids
+
+
+def test_query_cars_pages_through_null_sort_values(db):
+    # Cars 1, 3, 5, 7 and 9 have no price
+    _add_cars([None if number % 2 else 100 * number for number in range(1, 11)])
+
+    assert _all_pages(sort_by="price") == [1, 3, 5, 7, 9, 2, 4, 6, 8, 10]
+    assert _all_pages(sort_by="price", descending=True) == [10, 8, 6, 4, 2, 9, 7, 5, 3, 1]
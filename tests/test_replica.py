@@ -0,0 +1,23 @@
+import os
+
+import db2
+import db_replica
+
+
+def test_replicas_of_one_database_keep_separate_files(db):
+    first = db_replica.Replica(db2.DB_PATH)
+    second = db_replica.Replica(db2.DB_PATH)
+    try:
+        first.refresh()
+        second.refresh()
+        first_file, second_file = first._generations[-1].file, second._generations[-1].file
+        assert first_file != second_file
+
+        first.close()
+        assert not os.path.exists(first_file)
+        assert os.path.exists(second_file)
+        with db2.using(second.stats()["path"]):
+            assert db2.get_car_filter_options.uncached() == ([], [])
+    finally:
+        first.close()
+        second.close()
@@ -0,0 +1,19 @@
+import db2
+import snapshots
+
+
+def _add_car(plate, manufacture, price):
+    db2.add_car(manufacture, "Model", "", 1000, "Manual", "Petrol", plate, price, "White", "")
+
+
+def test_shared_snapshot_follows_writes(db):
+    _add_car("AA-1", "Toyota", 100.0)
+    _add_car("AA-2", "Honda", 200.0)
+    assert snapshots.inventory_totals() == db2.get_inventory_totals.uncached() == (2, 300.0)
+
+    db2.add_spare_part(1, "Tyres", 50.0)
+    db2.delete_car(2)
+    _add_car("AA-3", "Mazda", 300.0)
+    assert snapshots.inventory_totals() == db2.get_inventory_totals.uncached() == (2, 450.0)
+    assert snapshots.filter_options() == db2.get_car_filter_options.uncached()
+    assert snapshots._shared[db2.current_path()].full_loads == 1